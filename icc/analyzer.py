@@ -12,23 +12,26 @@ import pmt
 import signal
 import sys
 
+from pdu_sink import pdu_queue_sink
 
 
 """
 Block that analyses a specific cell tower ARFCN for a specified amount of time.
 Stores the capture in cfile format, and stores the bursts(frames)
-Sends the decoded stuff to all ports in the udp port list
+Sends the decoded stuff to all queues in the pdu queue list and to all ports in the udp port list
 """
 
 class Analyzer(gr.top_block):
 
-    def __init__(self, gain=None, samp_rate=None, ppm=None, arfcn=None, capture_id=None, udp_ports=[], max_timeslot=0, store_capture=True, verbose=False, band=None, rec_length=None, test=False, args=""):
+    def __init__(self, gain=None, samp_rate=None, ppm=None, arfcn=None, capture_id=None, pdu_queues=[], udp_ports=[], max_timeslot=0, store_capture=True, verbose=False, band=None, rec_length=None, test=False, args=""):
         """
         capture_id = identifier for the capture used to store the files (e.g. <capture_id>.cfile)
         store_capture = boolean indicating if the capture should be stored on disk or not
         rec_length = capture time in seconds
         max_timeslot = timeslot 0...max_timeslot will be decoded
-        udp_ports = a list of udp ports to send the captured GSMTap frames to
+        pdu_queues = a list of PDUQueues (e.g. DetectorManager.queue) to hand the captured GSMTap frames to in-process
+        udp_ports = a list of udp ports to send the captured GSMTap frames to, e.g. for external tools like Wireshark
+        args = osmosdr arguments of the device to capture with, e.g. rtl=0
         """
 
         gr.top_block.__init__(self, "Gr-gsm Capture")
@@ -52,6 +55,7 @@ class Analyzer(gr.top_block):
         self.rec_length = rec_length
         self.store_capture = store_capture
         self.capture_id = capture_id
+        self.pdu_queues = pdu_queues
         self.udp_ports = udp_ports
         self.verbose = verbose
 
@@ -59,7 +63,7 @@ class Analyzer(gr.top_block):
         # Processing Blocks
         ##################################################
 
-        self.rtlsdr_source = osmosdr.source( args="numchan=" + str(1) + " " + "" )
+        self.rtlsdr_source = osmosdr.source( args="numchan=" + str(1) + " " + args )
         self.rtlsdr_source.set_sample_rate(samp_rate)
         self.rtlsdr_source.set_center_freq(self.fc - shiftoff, 0)
         self.rtlsdr_source.set_freq_corr(ppm, 0)
@@ -101,6 +105,11 @@ class Analyzer(gr.top_block):
             self.gsm_control_channels_decoders.append(grgsm.control_channels_decoder())
 #        self.blocks_socket_pdu_0 = blocks.socket_pdu("UDP_CLIENT", "127.0.0.1", "4729", 10000, False)#        self.blocks_socket_pdu_0 = blocks.socket_pdu("UDP_CLIENT", "127.0.0.1", "4729", 10000, False)
 
+        #Sinks that hand all decoded packets to the detectors in this process
+        self.pdu_sinks = []
+        for pdu_queue in self.pdu_queues:
+            self.pdu_sinks.append(pdu_queue_sink(pdu_queue))
+
         #UDP client that sends all decoded C0T0 packets to the specified port on localhost if requested
         self.client_sockets = []
         self.server_sockets = []
@@ -157,6 +166,11 @@ class Analyzer(gr.top_block):
             self.msg_connect((self.gsm_sdcch8_demappers[i-1], 'bursts'), (self.gsm_control_channels_decoders[i], 'bursts'))
 
 
+        #Connect the in-process sinks
+        for pdu_sink in self.pdu_sinks:
+            for i in range(0,max_timeslot + 1):
+                self.msg_connect((self.gsm_control_channels_decoders[i], 'msgs'), (pdu_sink, 'msgs'))
+
         #Connect the UDP clients if requested
         for client_socket in self.client_sockets:
             for i in range(0,max_timeslot + 1):
@@ -229,7 +243,6 @@ class Analyzer(gr.top_block):
 
 
 if __name__ == '__main__':
-    udp_port = 2333
     arfcn = 0
     fc = 938.4e6 #Spiegel cell tower
     sample_rate = 2000000.052982
@@ -248,13 +261,13 @@ if __name__ == '__main__':
     from threading import Thread
     from detector_manager import DetectorManager
     from a5_detector import A5Detector
-    detector_man = DetectorManager(udp_port=udp_port)
+    detector_man = DetectorManager()
     detector_man.addDetector(A5Detector('a5_detector', 10))
     proc = Thread(target=detector_man.start)
     proc.start()
     analyzer = Analyzer(gain=gain, samp_rate=sample_rate,
                         ppm=ppm, arfcn=arfcn, capture_id="test0",
-                        udp_ports=[udp_port], rec_length=60, max_timeslot=2,
+                        pdu_queues=[detector_man.queue], rec_length=60, max_timeslot=2,
                         verbose=False, test=False)
     analyzer.start()
     analyzer.wait()
@@ -0,0 +1,22 @@
+import threading
+import time
+
+
+def run_until(top_block, done, min_time=0, poll_interval=0.1):
+    """
+    Runs the flowgraph until it finishes by itself, or until done() returns True
+    once the flowgraph ran for at least min_time seconds.
+    Returns the number of seconds the flowgraph ran.
+    """
+    start = time.time()
+    top_block.start()
+    waiter = threading.Thread(target=top_block.wait)
+    waiter.daemon = True
+    waiter.start()
+    while waiter.is_alive():
+        waiter.join(poll_interval)
+        if waiter.is_alive() and time.time() - start >= min_time and done():
+            top_block.stop()
+            waiter.join()
+    top_block.stop()
+    return time.time() - start
@@ -0,0 +1,47 @@
+import math
+import numpy
+
+# approximate radius of earth in km
+R = 6373.0
+
+
+def haversine(lat, lon, lats, lons):
+    """
+    Returns the distances in meters from the point (lat, lon) to the points given by
+    the arrays lats and lons, computed with a single vectorized haversine
+    """
+    rlat1 = numpy.radians(lat)
+    rlon1 = numpy.radians(lon)
+    rlat2 = numpy.radians(numpy.asarray(lats, dtype=float))
+    rlon2 = numpy.radians(numpy.asarray(lons, dtype=float))
+
+    dlon = rlon2 - rlon1
+    dlat = rlat2 - rlat1
+
+    a = numpy.sin(dlat / 2) ** 2 + numpy.cos(rlat1) * numpy.cos(rlat2) * numpy.sin(dlon / 2) ** 2
+    c = 2 * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1 - a))
+
+    return (R * c) * 1000
+
+
+def calc_distance(lat1, lon1, lat2, lon2):
+    """
+    Returns the distance in meters between two points
+    """
+    return float(haversine(lat1, lon1, lat2, lon2))
+
+
+def out_of_range(distances, ranges, range_multiplier=1):
+    """
+    Returns a boolean mask that is True where a distance exceeds range * range_multiplier
+    """
+    return numpy.asarray(distances, dtype=float) > numpy.asarray(ranges, dtype=float) * range_multiplier
+
+
+def bounding_box(lat, radius):
+    """
+    Returns the half height and half width in degrees of the box around a circle of radius meters at lat
+    """
+    dlat = math.degrees(radius / (R * 1000))
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return dlat, min(dlon, 180)
@@ -1,6 +1,8 @@
-from neighbours import neighbours
-from query_cell_tower import queryTower
+from neighbours import neighbours, Mesh
+from neighbour_graph import areaKey, updateAreaGraph, loadAreaMesh
+from query_cell_tower import queryTower, queryTowers
 from tower import Tower
+from tower_grid import TowerGrid, loadTowerGrid
 from tic import tic
-from lac import lac
+from lac import lac, lacBaseline
 from icc.aux import TowerRank
@@ -0,0 +1,98 @@
+import csv
+import gzip
+import itertools
+import os
+import sqlite3
+import time
+
+from query_cell_tower import tower_database
+from tower_index import buildTowerIndex, indexPath
+
+# column order of the opencellid cell export, which matches the towers table
+columns = ['radio', 'mcc', 'net', 'area', 'cell', 'unit', 'lon', 'lat', 'range', 'samples',
+           'changeable', 'created', 'updated', 'average_signal']
+
+create_table = """CREATE TABLE towers (
+    radio VARCHAR, mcc INTEGER, net INTEGER, area INTEGER, cell INTEGER, unit VARCHAR,
+    lon FLOAT, lat FLOAT, range INTEGER, samples INTEGER, changeable INTEGER,
+    created INTEGER, updated INTEGER, average_signal INTEGER)"""
+
+create_index = "CREATE INDEX towers_mcc_net_area_cell ON towers (mcc, net, area, cell)"
+# supports the bounding box query of TowerGrid.fromDatabase
+create_location_index = "CREATE INDEX IF NOT EXISTS towers_lat_lon ON towers (lat, lon)"
+
+# trade durability for speed, an interrupted import is simply run again
+import_pragmas = ['PRAGMA journal_mode = OFF',
+                  'PRAGMA synchronous = OFF',
+                  'PRAGMA locking_mode = EXCLUSIVE',
+                  'PRAGMA temp_store = MEMORY',
+                  'PRAGMA cache_size = -262144'] # KiB
+
+
+def openCsv(csv_file):
+    if csv_file.endswith('.gz'):
+        return gzip.open(csv_file, 'rb')
+    return open(csv_file, 'rb')
+
+
+def createLocationIndex(database=tower_database):
+    """
+    Adds the (lat, lon) index to a database imported before the index existed
+    """
+    connection = sqlite3.connect(database)
+    with connection:
+        connection.execute(create_location_index)
+    connection.close()
+
+
+def importTowers(csv_file, database=tower_database, mccs=None, radios=None, chunk_size=100000, build_index=True):
+    """
+    Builds the towers table of database from an opencellid csv export (optionally gzipped).
+    The csv file is streamed in chunks of chunk_size rows, every chunk is inserted in one transaction
+    and the (mcc, net, area, cell) and (lat, lon) indexes are created once all rows are inserted.
+    mccs, radios = only import the towers with one of the given mobile country codes and radio types
+    build_index = rebuild the memory-mapped tower index, otherwise a stale index is removed
+    Returns the number of imported towers
+    """
+    mccs = set(str(mcc) for mcc in mccs) if mccs else None
+    radios = set(radios) if radios else None
+
+    connection = sqlite3.connect(database)
+    for pragma in import_pragmas:
+        connection.execute(pragma)
+    connection.execute('DROP TABLE IF EXISTS towers')
+    connection.execute(create_table)
+    insert = 'INSERT INTO towers VALUES (%s)' % ', '.join(['?'] * len(columns))
+
+    start = time.time()
+    imported = 0
+    with openCsv(csv_file) as f:
+        rows = csv.reader(f)
+        for row in rows:
+            if row and row[0] != 'radio': # skip the header
+                rows = itertools.chain([row], rows)
+                break
+        rows = (row[:len(columns)] for row in rows if len(row) >= len(columns)
+                and (mccs is None or row[1] in mccs) and (radios is None or row[0] in radios))
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            with connection:
+                connection.executemany(insert, chunk)
+            imported += len(chunk)
+            print "Imported %d towers (%.0f towers/s)" % (imported, imported / (time.time() - start))
+
+    print "Creating indexes..."
+    with connection:
+        connection.execute(create_index)
+        connection.execute(create_location_index)
+    connection.execute('ANALYZE')
+    connection.close()
+
+    if build_index:
+        print "Indexed %d towers in %s" % (buildTowerIndex(database), indexPath(database))
+    elif os.path.exists(indexPath(database)):
+        os.remove(indexPath(database))
+    print "Imported %d towers into %s in %.1f seconds" % (imported, database, time.time() - start)
+    return imported
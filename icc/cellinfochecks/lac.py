@@ -1,24 +1,64 @@
 from icc.aux import TowerRank
+from icc.aux.geo import bounding_box, haversine
+from icc.models import CellObservation, Scan
 from collections import Counter
 
 lac_threshold = .25 # % of most common LAC
+baseline_radius = 2000 # meters around the current location of the past scans used as LAC baseline
 
-def lac(found_list):
+def lacBaseline(session, lat, lon, radius=baseline_radius, exclude_scan_id=None):
+    """
+    Counts the local area codes observed in the stored scans within radius meters of (lat, lon)
+    Returns a dict from (mcc, mnc) to a Counter of the local area codes of that operator
+    """
+    dlat, dlon = bounding_box(lat, radius)
+    query = session.query(CellObservation.mcc, CellObservation.mnc, CellObservation.lac, Scan.latitude, Scan.longitude) \
+        .join(Scan, CellObservation.scan_id == Scan.id) \
+        .filter(Scan.latitude.between(lat - dlat, lat + dlat), Scan.longitude.between(lon - dlon, lon + dlon))
+    if exclude_scan_id is not None:
+        query = query.filter(Scan.id != exclude_scan_id)
+    rows = query.all()
+
+    baseline = {}
+    if rows:
+        distances = haversine(lat, lon, [r.latitude for r in rows], [r.longitude for r in rows])
+        for r, distance in zip(rows, distances):
+            if distance <= radius:
+                baseline.setdefault((r.mcc, r.mnc), Counter())[r.lac] += 1
+    return baseline
+
+def lac(found_list, expected=None, baseline=None):
+# expected = towers that should be audible at the current location (see TowerGrid.expected),
+# a local area code that none of the expected towers of the operator use is reported
+# baseline = local area codes seen in past scans near the current location (see lacBaseline),
+# when given a local area code is judged against the past and the current observations together
     ranks = []
+
+    known_lacs = {}
+    for tower in expected or []:
+        known_lacs.setdefault((tower.mcc, tower.mnc), set()).add(tower.lac)
+
+    ## counting the local area codes per operator in one pass
+    areacounters = {}
+    for info in found_list:
+        areacounters.setdefault((info.mcc, info.mnc), Counter())[info.lac] += 1
+    for operator, areacounter in areacounters.iteritems():
+        if baseline and operator in baseline:
+            areacounter.update(baseline[operator])
+    most_common = dict((operator, areacounter.most_common(1)[0][1]) for operator, areacounter in areacounters.iteritems())
+
     for info in sorted(found_list):
         rank = 0
         comment = "Common local area code"
+        operator = (info.mcc, info.mnc)
 
         ## checking local area code consistency
-        lacodes = []
-        for tower in found_list:
-            if info.mcc == tower.mcc and info.mnc == info.mnc:
-                lacodes.append(tower.lac)
-
-        areacounter = Counter(lacodes)
-        if (areacounter.most_common(1)[0][1] * lac_threshold) > areacounter[info.lac]:
+        if (most_common[operator] * lac_threshold) > areacounters[operator][info.lac]:
             comment = "Uncommon local area code"
             rank = 1
+        elif operator in known_lacs and info.lac not in known_lacs[operator]:
+            comment = "Local area code not used by the known towers near this location"
+            rank = 1
 
         ranks.append(TowerRank(rank, "lac", comment, info.cellobservation_id))
 
@@ -0,0 +1,75 @@
+from sqlalchemy import and_, or_
+import datetime
+
+from icc.models import AreaNeighbourLink
+from neighbours import Mesh
+
+query_chunk_size = 100 # areas per query, keeps the bound parameters below the SQLite limit of 999
+
+
+def areaKey(info):
+    return (info.mcc, info.mnc, info.lac)
+
+
+def _linksOf(session, vertices_by_area):
+    """
+    Yields the stored links of the given areas, only those leaving the given vertices if they are not None
+    """
+    areas = list(vertices_by_area)
+    for i in xrange(0, len(areas), query_chunk_size):
+        conditions = []
+        for (mcc, mnc, lac) in areas[i:i + query_chunk_size]:
+            condition = and_(AreaNeighbourLink.mcc == mcc, AreaNeighbourLink.mnc == mnc, AreaNeighbourLink.lac == lac)
+            if vertices_by_area[(mcc, mnc, lac)] is not None:
+                condition = and_(condition, AreaNeighbourLink.src_arfcn.in_(vertices_by_area[(mcc, mnc, lac)]))
+            conditions.append(condition)
+        for link in session.query(AreaNeighbourLink).filter(or_(*conditions)):
+            yield link
+
+
+def updateAreaGraph(session, found_list, timestamp=None):
+    """
+    Adds the neighbour edges of the found cells to the aggregated neighbour graph of their areas.
+    Only the links leaving the found cells are read and written, the rest of the graph is untouched.
+    Returns the number of links that were updated and inserted
+    """
+    if timestamp is None:
+        timestamp = datetime.datetime.now()
+
+    edges = {}
+    for info in found_list:
+        edges.setdefault(areaKey(info), {}).setdefault(info.arfcn, set()).update(info.neighbours)
+    if not edges:
+        return 0, 0
+
+    updated = 0
+    for link in _linksOf(session, dict((area, list(vertices)) for area, vertices in edges.iteritems())):
+        dsts = edges[(link.mcc, link.mnc, link.lac)][link.src_arfcn]
+        if link.dst_arfcn in dsts:
+            link.count += 1
+            link.last_seen = timestamp
+            dsts.discard(link.dst_arfcn)
+            updated += 1
+
+    inserted = 0
+    for (mcc, mnc, lac), vertices in edges.iteritems():
+        for src, dsts in vertices.iteritems():
+            for dst in dsts:
+                session.add(AreaNeighbourLink(mcc=mcc, mnc=mnc, lac=lac, src_arfcn=src, dst_arfcn=dst,
+                                              count=1, last_seen=timestamp))
+                inserted += 1
+    session.commit()
+    return updated, inserted
+
+
+def loadAreaMesh(session, areas, min_count=1, since=None):
+    """
+    Returns the aggregated neighbour graph of the given (mcc, mnc, lac) areas as a Mesh of arfcns,
+    with the links seen in at least min_count scans and, if given, last seen after since
+    """
+    mesh = Mesh()
+    for link in _linksOf(session, dict((area, None) for area in set(areas))):
+        if link.count >= min_count and (since is None or link.last_seen >= since):
+            mesh.add_vertex(link.src_arfcn)
+            mesh.add_edge((link.src_arfcn, link.dst_arfcn))
+    return mesh
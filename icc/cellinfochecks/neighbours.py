@@ -5,15 +5,59 @@ from icc.aux import TowerRank
 class Mesh:
     def __init__(self):
         self.edges = {}
+        self.reverse_edges = {}
+        # union-find forest of the (weakly) connected components of the vertices
+        self.parents = {}
+        self.component_sizes = {}
 
     def add_vertex(self, vertex):
         if vertex not in self.edges:
             self.edges[vertex] = set()
+            self.parents[vertex] = vertex
+            self.component_sizes[vertex] = 1
+            # edges pointing to the vertex may have been added before the vertex itself
+            for src in self.reverse_edges.get(vertex, ()):
+                self.union(src, vertex)
 
     def add_edge(self, edge):
         (src, dst) = edge
         assert src in self.edges
         self.edges[src].add(dst)
+        self.reverse_edges.setdefault(dst, set()).add(src)
+        if dst in self.edges:
+            self.union(src, dst)
+
+    def add_mesh(self, other):
+        for vertex in other.vertices():
+            self.add_vertex(vertex)
+        for src, dsts in other.edges.iteritems():
+            for dst in dsts:
+                self.add_edge((src, dst))
+
+    def find(self, vertex):
+        root = self.parents[vertex]
+        while root != self.parents[root]:
+            self.parents[root] = self.parents[self.parents[root]]
+            root = self.parents[root]
+        self.parents[vertex] = root
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            if self.component_sizes[a] < self.component_sizes[b]:
+                a, b = b, a
+            self.parents[b] = a
+            self.component_sizes[a] += self.component_sizes.pop(b)
+
+    def component_size(self, vertex):
+        return self.component_sizes[self.find(vertex)]
+
+    def out_degree(self, vertex):
+        return len(self.edges[vertex])
+
+    def in_degree(self, vertex):
+        return len(self.reverse_edges.get(vertex, ()))
 
     def vertices(self):
         return self.edges.keys()
@@ -42,10 +86,8 @@ class Mesh:
 
     def find_edges_to(self, vertex):
         edges = set()
-        for src in self.edges:
-            for dst in self.edges[src]:
-                if dst == vertex:
-                    edges.add((src, dst))
+        for src in self.reverse_edges.get(vertex, ()):
+            edges.add((src, vertex))
         return edges
 
     def __repr__(self):
@@ -55,25 +97,30 @@ class Mesh:
 min_submash_size = 3
 
 
-def neighbours(found_list):
+def neighbours(found_list, mesh=None):
+# mesh = neighbour graph of earlier scans, e.g. of a whole city, the cells found now are judged against
+# a copy of it merged with the current observations. Whether a cell has neighbours only depends on the
+# neighbour list it broadcasts now, the history only counts for the references and the component size
     ranks = []
     info_map = {}
-    mesh = Mesh()
+    merged = Mesh()
+    if mesh is not None:
+        merged.add_mesh(mesh)
     for info in sorted(found_list):
         info_map[info.arfcn] = info
-        mesh.add_vertex(info.arfcn)
+        merged.add_vertex(info.arfcn)
         for neighbour in info.neighbours:
-            mesh.add_edge((info.arfcn, neighbour))
-    for vertex in mesh.vertices():
+            merged.add_edge((info.arfcn, neighbour))
+    for vertex in info_map:
         rank = 0
         comment = None
-        if len(mesh.find_edges_from(vertex)) == 0:  # TODO: can be 0 due to inconsistent tower scan
+        if len(info_map[vertex].neighbours) == 0:  # TODO: can be 0 due to inconsistent tower scan
             rank = 2
             comment = "Cell '%s' has no neighbours" % vertex
-        elif len(mesh.find_edges_to(vertex)) == 0:
+        elif merged.in_degree(vertex) == 0:
             rank = 2
             comment = "Cell '%s' is not referenced in the network" % vertex
-        elif mesh.find_submesh(vertex).size() < min_submash_size:
+        elif merged.component_size(vertex) < min_submash_size:
             rank = 1
             comment = "Cell only has few neighbours"
         else:
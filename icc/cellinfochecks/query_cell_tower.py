@@ -1,18 +1,163 @@
-from sqlalchemy import create_engine
+from collections import OrderedDict, namedtuple
+from sqlalchemy import create_engine, event, and_, or_
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+import os
+import threading
 
 from tower import Tower
+from tower_index import TowerIndex, indexPath
+
+tower_database = 'opencellid-nl.sqlite'
+cache_size = 4096 # number of (mcc, mnc, lac, cid) lookups kept in memory
+query_chunk_size = 200 # towers per bulk query, keeps the bound parameters below the SQLite limit of 999
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+_session_class = None
+_tower_index = None
+_tower_index_mtime = None
+_cache = OrderedDict()
+_cache_hits = 0
+_cache_misses = 0
+_lock = threading.Lock()
+
+
+def _set_query_only(dbapi_connection, connection_record):
+    dbapi_connection.execute('PRAGMA query_only = ON')
+
+
+def getSession():
+    """
+    Returns a session on the tower database. The engine is created once and pools
+    read-only connections, which may be shared between threads.
+    """
+    global _session_class
+    with _lock:
+        if _session_class is None:
+            engine = create_engine('sqlite:///' + tower_database, poolclass=QueuePool,
+                                   connect_args={'check_same_thread': False})
+            event.listen(engine, 'connect', _set_query_only)
+            _session_class = sessionmaker(bind=engine)
+    return _session_class()
+
+
+def getTowerIndex():
+    """
+    Returns the memory-mapped index next to the tower database, or None when it has not been built.
+    The index is reloaded when its file changes, e.g. when it is built or rebuilt while icc runs
+    """
+    global _tower_index, _tower_index_mtime
+    path = indexPath(tower_database)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _lock:
+        if mtime != _tower_index_mtime:
+            _tower_index = TowerIndex(path) if mtime is not None else None
+            _tower_index_mtime = mtime
+        return _tower_index
+
+
+def _cacheGet(key):
+    global _cache_hits, _cache_misses
+    with _lock:
+        if key in _cache:
+            _cache_hits += 1
+            result_list = _cache.pop(key)
+            _cache[key] = result_list
+            return result_list
+        _cache_misses += 1
+        return None
+
+
+def _cachePut(key, result_list):
+    with _lock:
+        _cache.pop(key, None)
+        _cache[key] = result_list
+        while len(_cache) > cache_size:
+            _cache.popitem(last=False)
+
+
+def cacheInfo():
+    """
+    Returns the hits, misses, maximum and current size of the tower lookup cache
+    """
+    with _lock:
+        return CacheInfo(_cache_hits, _cache_misses, cache_size, len(_cache))
+
+
+def clearCache():
+    global _cache_hits, _cache_misses
+    with _lock:
+        _cache.clear()
+        _cache_hits = 0
+        _cache_misses = 0
+
+
+def towerKey(mcc, mnc, lac, cell_id):
+    return (int(mcc), int(mnc), int(lac), int(cell_id))
+
 
 def queryTower(mcc, mnc, lac, cell_id):
     """
-    Queries the database for cell towers selected by the given arguments
+    Queries the database (or its index, when built) for cell towers selected by the given arguments
     Returns the results as a list
     """
+    key = towerKey(mcc, mnc, lac, cell_id)
+    index = getTowerIndex()
+    if index:
+        return index.lookup(*key)
+
+    result_list = _cacheGet(key)
+    if result_list is not None:
+        return list(result_list)
+
+    session = getSession()
+    try:
+        result_list = session.query(Tower).filter_by(mcc=key[0], net=key[1], area=key[2], cell=key[3]).all()
+    finally:
+        session.close()
+
+    _cachePut(key, result_list)
+    return list(result_list)
+
+
+def queryTowers(keys):
+    """
+    Queries the database for the cell towers of all given (mcc, mnc, lac, cell_id) keys,
+    using one query per query_chunk_size keys that are not cached yet.
+    Returns a dict from each key to the list of towers found for it
+    """
+    index = getTowerIndex()
+    if index:
+        return index.lookupMany(set(towerKey(*key) for key in keys))
+
+    results = {}
+    missing = []
+    for key in set(towerKey(*key) for key in keys):
+        result_list = _cacheGet(key)
+        if result_list is not None:
+            results[key] = list(result_list)
+        else:
+            results[key] = []
+            missing.append(key)
 
-    engine = create_engine('sqlite:///opencellid-nl.sqlite')
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    if missing:
+        session = getSession()
+        try:
+            for i in xrange(0, len(missing), query_chunk_size):
+                chunk = missing[i:i + query_chunk_size]
+                condition = or_(*[and_(Tower.mcc == mcc, Tower.net == mnc, Tower.area == lac, Tower.cell == cell_id)
+                                  for (mcc, mnc, lac, cell_id) in chunk])
+                for tower in session.query(Tower).filter(condition):
+                    results[towerKey(tower.mcc, tower.net, tower.area, tower.cell)].append(tower)
+        finally:
+            session.close()
 
-    result_list = session.query(Tower).filter_by(mcc=mcc, net=mnc, area=lac, cell=cell_id).all()
+        for key in missing:
+            _cachePut(key, list(results[key]))
 
-    return result_list
+    return results
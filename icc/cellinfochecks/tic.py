@@ -1,47 +1,54 @@
 import query_cell_tower as CellTower
-import math
 from icc.aux import TowerRank
+from icc.aux.geo import haversine, out_of_range
+from tower_grid import compareExpected
 
-def calc_distance(lat1, lon1, lat2, lon2):
-    # approximate radius of earth in km
-    R = 6373.0
-
-    rlat1 = math.radians(lat1)
-    rlon1 = math.radians(lon1)
-    rlat2 = math.radians(lat2)
-    rlon2 = math.radians(lon2)
-
-    dlon = rlon2 - rlon1
-    dlat = rlat2 - rlat1
-
-    a = math.sin(dlat / 2)**2 + math.cos(rlat1) * math.cos(rlat2) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    return (R * c) * 1000
-
-def tic(found_list, current_lat=52.2311057, current_lon=6.8553815, range_multiplier=1, verbose=False):
+def tic(found_list, current_lat=52.2311057, current_lon=6.8553815, range_multiplier=1, verbose=False, expected=None):
 # Tower Information Consistency Check
+# expected = towers that should be audible at the current location (see TowerGrid.expected, computed with
+# the same range_multiplier). Observed towers among them are in range without a database lookup and
+# every expected tower that was not observed is ranked, with cellobs_id None as it belongs to no observation.
     ranks = []
 
 
     if len(found_list) > 0:
         print("Printing cell tower info and checking database....")
-        for info in sorted(found_list):
+        infos = sorted(found_list)
+        lookup = infos
+        if expected is not None:
+            missing, lookup = compareExpected(infos, expected)
+            print "%d of the expected cell towers were not observed" % len(missing)
+            for tower in missing:
+                comment = "Expected cell tower not observed: MCC: %3u, MNC: %3u, LAC: %5u, CID: %5u at %d m (range %d m)" % (
+                    tower.mcc, tower.mnc, tower.lac, tower.cid, tower.distance, tower.range)
+                if verbose:
+                    print comment
+                ranks.append(TowerRank(1, "tic", comment, None))
+        towers_by_key = CellTower.queryTowers([(info.mcc, info.mnc, info.lac, info.cid) for info in lookup])
+
+        ## checking the location of all towers found in the database at once
+        db_towers = [towers_by_key.get(CellTower.towerKey(info.mcc, info.mnc, info.lac, info.cid)) for info in infos]
+        located = [towers[0] for towers in db_towers if towers]
+        distances = haversine(current_lat, current_lon, [t.lat for t in located], [t.lon for t in located])
+        wrong_location = out_of_range(distances, [t.range for t in located], range_multiplier)
+
+        i = 0
+        for info, towers in zip(infos, db_towers):
             ## checking database information
             rank = 0
             comment = None
             #print info
             if verbose:
                 print info.get_verbose_info()
-            towers = CellTower.queryTower(info.mcc, info.mnc, info.lac, info.cid)
-            if len(towers) > 0:
-                tower = towers[0]
-                distance = calc_distance(tower.lat, tower.lon, current_lat, current_lon)
-                if distance > (tower.range * range_multiplier):
-                    comment = "Cell tower found in database, but in wrong location %d m (range %d m)" % (distance, tower.range)
+            if towers is None:
+                comment = "Cell tower found in database and is in range"
+            elif len(towers) > 0:
+                if wrong_location[i]:
+                    comment = "Cell tower found in database, but in wrong location %d m (range %d m)" % (distances[i], towers[0].range)
                     rank = 1
                 else:
                     comment = "Cell tower found in database and is in range"
+                i += 1
             else:
                 comment = "No match found in database"
                 rank = 1
@@ -0,0 +1,146 @@
+"""
+Spatial index of known towers, used to ask which towers should be audible at a location.
+
+The towers are bucketed in a lat/lon grid of cell_size degrees. A radius query only computes
+distances for the towers in the grid cells that overlap the bounding box of the circle.
+"""
+
+from collections import namedtuple
+import math
+import numpy
+import os
+import sqlite3
+
+from icc.aux.geo import bounding_box, haversine
+import query_cell_tower
+from tower_index import numeric
+
+cell_size = 0.05 # grid cell size in degrees, about 5.5 km north-south
+search_radius = 35000 # meters, the maximum range of a GSM cell (timing advance 63)
+
+GridTower = namedtuple('GridTower', ['mcc', 'mnc', 'lac', 'cid', 'lat', 'lon', 'range', 'distance'])
+
+
+class TowerGrid(object):
+
+    def __init__(self, mcc, mnc, lac, cid, lat, lon, ranges, cell_size=cell_size):
+        self.cell_size = cell_size
+        lat = numpy.asarray(lat, dtype=float)
+        lon = numpy.asarray(lon, dtype=float)
+        rows = numpy.floor(lat / cell_size).astype(numpy.int64)
+        cols = numpy.floor(lon / cell_size).astype(numpy.int64)
+        order = numpy.lexsort((cols, rows))
+
+        self.mcc = numpy.asarray(mcc, dtype=numpy.int64)[order]
+        self.mnc = numpy.asarray(mnc, dtype=numpy.int64)[order]
+        self.lac = numpy.asarray(lac, dtype=numpy.int64)[order]
+        self.cid = numpy.asarray(cid, dtype=numpy.int64)[order]
+        self.lat = lat[order]
+        self.lon = lon[order]
+        self.range = numpy.asarray(ranges, dtype=float)[order]
+
+        # grid cell -> (start, stop) slice of the sorted columns
+        self.buckets = {}
+        rows, cols = rows[order], cols[order]
+        if len(order) > 0:
+            edges = numpy.flatnonzero((numpy.diff(rows) != 0) | (numpy.diff(cols) != 0)) + 1
+            starts = numpy.concatenate(([0], edges))
+            stops = numpy.concatenate((edges, [len(order)]))
+            for start, stop in zip(starts, stops):
+                self.buckets[(rows[start], cols[start])] = (start, stop)
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def fromDatabase(cls, database, lat, lon, radius=search_radius, radios=('GSM',)):
+        """
+        Builds a grid of the towers in database within radius meters of (lat, lon),
+        optionally only the towers with one of the given radio types
+        """
+        if not os.path.exists(database):
+            return cls(*[[]] * 7)
+        dlat, dlon = bounding_box(lat, radius)
+        query = 'SELECT mcc, net, area, cell, lat, lon, CASE WHEN %s THEN range ELSE 0 END FROM towers ' \
+                'WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? AND %s' % (
+                    numeric % 'range', ' AND '.join(numeric % column for column in ('mcc', 'net', 'area', 'cell')))
+        parameters = [lat - dlat, lat + dlat, lon - dlon, lon + dlon]
+        if radios:
+            query += ' AND radio IN (%s)' % ', '.join(['?'] * len(radios))
+            parameters += list(radios)
+        connection = sqlite3.connect(database)
+        try:
+            rows = connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+        columns = zip(*rows) if rows else [[]] * 7
+        return cls(*columns)
+
+    def candidates(self, lat, lon, radius):
+        """
+        Returns the indices of the towers in the grid cells overlapping the circle
+        """
+        dlat, dlon = bounding_box(lat, radius)
+        row_min, row_max = int(math.floor((lat - dlat) / self.cell_size)), int(math.floor((lat + dlat) / self.cell_size))
+        col_min, col_max = int(math.floor((lon - dlon) / self.cell_size)), int(math.floor((lon + dlon) / self.cell_size))
+        slices = []
+        for row in xrange(row_min, row_max + 1):
+            for col in xrange(col_min, col_max + 1):
+                if (row, col) in self.buckets:
+                    start, stop = self.buckets[(row, col)]
+                    slices.append(numpy.arange(start, stop))
+        return numpy.concatenate(slices) if slices else numpy.zeros(0, dtype=numpy.int64)
+
+    def towers(self, indices, distances):
+        return [GridTower(int(self.mcc[i]), int(self.mnc[i]), int(self.lac[i]), int(self.cid[i]),
+                          float(self.lat[i]), float(self.lon[i]), int(self.range[i]), float(d))
+                for i, d in zip(indices, distances)]
+
+    def near(self, lat, lon, radius, mcc=None, mnc=None):
+        """
+        Returns the towers within radius meters of (lat, lon), optionally only those of one operator
+        """
+        indices = self.candidates(lat, lon, radius)
+        if mcc is not None:
+            indices = indices[self.mcc[indices] == mcc]
+        if mnc is not None:
+            indices = indices[self.mnc[indices] == mnc]
+        distances = haversine(lat, lon, self.lat[indices], self.lon[indices])
+        inside = distances <= radius
+        return self.towers(indices[inside], distances[inside])
+
+    def expected(self, lat, lon, mcc=None, mnc=None, range_multiplier=1, radius=search_radius):
+        """
+        Returns the towers whose range (times range_multiplier) covers (lat, lon),
+        i.e. the towers that should be audible there, optionally only those of one operator
+        """
+        return [t for t in self.near(lat, lon, radius, mcc, mnc) if t.distance <= t.range * range_multiplier]
+
+
+def loadTowerGrid(lat, lon, radius=search_radius, radios=('GSM',)):
+    """
+    Returns a grid of the towers in the tower database around (lat, lon)
+    """
+    return TowerGrid.fromDatabase(query_cell_tower.tower_database, lat, lon, radius, radios)
+
+
+def compareExpected(found_list, expected):
+    """
+    Compares the observed channel infos with the expected towers in one pass.
+    Only the expected towers of the operators that were observed are taken into account.
+    Returns (missing, unexpected): the expected towers that were not observed and
+    the channel infos that are not among the expected towers
+    """
+    observed = set((info.mcc, info.mnc, info.lac, info.cid) for info in found_list)
+    operators = set((info.mcc, info.mnc) for info in found_list)
+    expected = [t for t in expected if (t.mcc, t.mnc) in operators]
+    expected_keys = set((t.mcc, t.mnc, t.lac, t.cid) for t in expected)
+
+    missing = []
+    for t in expected:
+        key = (t.mcc, t.mnc, t.lac, t.cid)
+        if key not in observed:
+            missing.append(t)
+            observed.add(key) # report every missing tower once
+    unexpected = [info for info in found_list if (info.mcc, info.mnc, info.lac, info.cid) not in expected_keys]
+    return missing, unexpected
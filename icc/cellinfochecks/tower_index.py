@@ -0,0 +1,150 @@
+"""
+Compact on-disk index of the towers table.
+
+The file starts with a 16 byte header (magic, number of towers) followed by four columns:
+the sorted packed (mcc, mnc, lac, cid) keys, lat, lon and range. The columns are opened
+with numpy.memmap, so opening the index costs nothing and the pages are shared between
+processes through the page cache.
+"""
+
+import numpy
+import os
+import sqlite3
+import struct
+
+magic = 'ICCTWR01'
+header = struct.Struct('<8sQ')
+
+# bits of the packed key used by mcc, mnc, lac and cid
+mcc_bits, mnc_bits, lac_bits, cid_bits = 10, 10, 16, 28
+
+fetch_size = 100000 # rows read from the database at once while building the index
+
+# the csv importer stores missing values as empty strings, towers without a numeric key or location
+# are left out of the index and a missing range counts as 0
+numeric = "typeof(%s) IN ('integer', 'real')"
+index_query = 'SELECT mcc, net, area, cell, lat, lon, CASE WHEN %s THEN range ELSE 0 END FROM towers WHERE %s' % (
+    numeric % 'range', ' AND '.join(numeric % column for column in ('mcc', 'net', 'area', 'cell', 'lat', 'lon')))
+
+
+def packKeys(mcc, mnc, lac, cid):
+    """
+    Packs (arrays of) mcc, mnc, lac and cid into uint64 keys that sort like the tuples
+    """
+    key = numpy.asarray(mcc, dtype=numpy.uint64) << numpy.uint64(mnc_bits + lac_bits + cid_bits)
+    key |= numpy.asarray(mnc, dtype=numpy.uint64) << numpy.uint64(lac_bits + cid_bits)
+    key |= numpy.asarray(lac, dtype=numpy.uint64) << numpy.uint64(cid_bits)
+    key |= numpy.asarray(cid, dtype=numpy.uint64)
+    return key
+
+
+def packable(mcc, mnc, lac, cid):
+    """
+    Returns a mask that is True where the values fit in a packed key
+    """
+    mask = numpy.ones(numpy.shape(mcc), dtype=bool)
+    for values, bits in ((mcc, mcc_bits), (mnc, mnc_bits), (lac, lac_bits), (cid, cid_bits)):
+        values = numpy.asarray(values)
+        mask &= (values >= 0) & (values < (1 << bits))
+    return mask
+
+
+def indexPath(database):
+    return os.path.splitext(database)[0] + '.idx'
+
+
+class TowerRecord(object):
+    __slots__ = ('lat', 'lon', 'range')
+
+    def __init__(self, lat, lon, range):
+        self.lat = lat
+        self.lon = lon
+        self.range = range
+
+    def __repr__(self):
+        return "<TowerRecord(lat='%s', lon='%s', range='%s')>" % (self.lat, self.lon, self.range)
+
+
+class TowerIndex(object):
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            file_magic, self.size = header.unpack(f.read(header.size))
+        if file_magic != magic:
+            raise ValueError("%s is not a tower index" % path)
+        n = self.size
+        if n == 0:
+            self.keys = numpy.zeros(0, dtype='<u8')
+            self.lat = self.lon = numpy.zeros(0, dtype='<f8')
+            self.range = numpy.zeros(0, dtype='<i4')
+        else:
+            self.keys = numpy.memmap(path, dtype='<u8', mode='r', offset=header.size, shape=(n,))
+            self.lat = numpy.memmap(path, dtype='<f8', mode='r', offset=header.size + 8 * n, shape=(n,))
+            self.lon = numpy.memmap(path, dtype='<f8', mode='r', offset=header.size + 16 * n, shape=(n,))
+            self.range = numpy.memmap(path, dtype='<i4', mode='r', offset=header.size + 24 * n, shape=(n,))
+
+    def records(self, start, stop):
+        return [TowerRecord(float(self.lat[i]), float(self.lon[i]), int(self.range[i])) for i in xrange(start, stop)]
+
+    def lookup(self, mcc, mnc, lac, cid):
+        """
+        Returns the list of towers with the given mcc, mnc, lac and cid
+        """
+        if not packable(mcc, mnc, lac, cid):
+            return []
+        key = packKeys(mcc, mnc, lac, cid)
+        start = numpy.searchsorted(self.keys, key, 'left')
+        stop = numpy.searchsorted(self.keys, key, 'right')
+        return self.records(start, stop)
+
+    def lookupMany(self, keys):
+        """
+        Returns a dict from each (mcc, mnc, lac, cid) key to the list of towers found for it
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        mcc, mnc, lac, cid = numpy.array(keys, dtype=numpy.int64).T
+        valid = packable(mcc, mnc, lac, cid)
+        packed = packKeys(numpy.where(valid, mcc, 0), numpy.where(valid, mnc, 0),
+                          numpy.where(valid, lac, 0), numpy.where(valid, cid, 0))
+        starts = numpy.searchsorted(self.keys, packed, 'left')
+        stops = numpy.searchsorted(self.keys, packed, 'right')
+        results = {}
+        for key, ok, start, stop in zip(keys, valid, starts, stops):
+            results[key] = self.records(start, stop) if ok else []
+        return results
+
+
+def buildTowerIndex(database, path=None):
+    """
+    Writes the tower index of the towers table in database to path (default: database with .idx extension)
+    Returns the number of indexed towers
+    """
+    if path is None:
+        path = indexPath(database)
+    connection = sqlite3.connect(database)
+    cursor = connection.execute(index_query)
+    columns = [[] for i in xrange(7)]
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        for column, values in zip(columns, zip(*rows)):
+            column.append(numpy.array(values, dtype=float))
+    connection.close()
+
+    mcc, mnc, lac, cid, lat, lon, ranges = [numpy.concatenate(c) if c else numpy.zeros(0) for c in columns]
+    valid = packable(mcc, mnc, lac, cid)
+    keys = packKeys(mcc[valid], mnc[valid], lac[valid], cid[valid])
+    order = numpy.argsort(keys, kind='mergesort')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header.pack(magic, len(keys)))
+        keys[order].astype('<u8').tofile(f)
+        lat[valid][order].astype('<f8').tofile(f)
+        lon[valid][order].astype('<f8').tofile(f)
+        ranges[valid][order].astype('<i4').tofile(f)
+    os.rename(tmp_path, path)
+    return len(keys)
@@ -1,45 +1,202 @@
 from detectors.detector import Detector
+from icc import gsmdecoder
+import Queue
+import errno
+import os
+import select
 import socket
+import threading
+
+max_datagram_size = 4096 # bytes, larger datagrams are counted as truncated
+receive_batch_size = 64 # datagrams drained from the socket per wakeup
+receive_buffer_seconds = 2 # seconds of traffic at the expected packet rate the kernel buffer should hold
+kernel_packet_size = 1024 # bytes the kernel accounts per queued GSMTap datagram (payload plus overhead)
+pdu_queue_size = 10000 # GSMTap frames buffered between the flowgraph and the detectors
+
+
+class PDUQueue(Queue.Queue):
+    """
+    Bounded queue that carries the GSMTap frames from a pdu_queue_sink to a DetectorManager
+    """
+
+    def __init__(self, maxsize=pdu_queue_size):
+        Queue.Queue.__init__(self, maxsize)
+        self.dropped = 0
+
+    def offer(self, pdu):
+        """
+        Adds the pdu without blocking the flowgraph, the pdu is dropped and counted if the queue is full
+        """
+        try:
+            self.put_nowait(pdu)
+        except Queue.Full:
+            self.dropped += 1
+
 
 class DetectorManager():
 
-    def __init__(self, udp_port):
+    def __init__(self, udp_port=None, expected_rate=500):
         """
         Parameters:
-        hooks = list of functions to call with the received frame as argument
+        udp_port = port on localhost to receive the GSMTap frames on. If None the frames are read
+                   from self.queue, which should be connected to the flowgraph with a pdu_queue_sink
+        expected_rate = expected number of GSMTap frames per second, used to size the socket receive buffer
         """
         self.udp_port = udp_port
+        self.expected_rate = expected_rate
         self.sock = None
+        self.queue = PDUQueue() if udp_port is None else None
         self.running = False
+        self.finished = threading.Event()
         self.detectors = []
+        self.received = 0
+        self.truncated = 0
+        self.dropped = 0
+        self.kernel_drops = None
+        # dispatch table from a routing key to the detectors subscribed to it
+        self.routes = {}
+        # detectors without subscriptions, they receive every packet
+        self.unrouted = []
 
     def addDetector(self, detector):
         if not isinstance(detector, Detector) or self.running is True:
             print "Could not add Detector to DetectorManager"
             return
         self.detectors.append(detector)
+        if detector.subscriptions is None:
+            self.unrouted.append(detector)
+        else:
+            for key in detector.subscriptions:
+                self.routes.setdefault(tuple(key), []).append(detector)
+
+    def dispatch(self, data):
+        """
+        Routes the GSMTap frame on its header to the subscribed detectors, decodes it once
+        if any detector wants it and hands the result to them.
+        Detectors that set parsed = False still receive the raw bytes.
+        """
+        detectors = self.routes.get(gsmdecoder.peek(data))
+        if detectors is None:
+            detectors = self.unrouted
+        elif self.unrouted:
+            detectors = detectors + self.unrouted
+        if not detectors:
+            return
+        packet = gsmdecoder.decode(data)
+        if packet is None:
+            return
+        for detector in detectors:
+            if detector.parsed:
+                detector.handle_packet(packet)
+            else:
+                detector.handle_packet(data)
 
     def start(self):
+        self.running = True
+        print "detectormanager started"
+        try:
+            if self.queue is not None:
+                self.receiveQueue()
+            else:
+                self.receiveUDP()
+        finally:
+            self.finished.set()
 
+    def receiveQueue(self):
+        """
+        Consumes the frames of the in-process transport until stopped and the queue is empty
+        """
+        while True:
+            try:
+                pdu = self.queue.get(timeout=0.2)
+            except Queue.Empty:
+                if not self.running:
+                    return
+                continue
+            self.received += 1
+            self.dispatch(pdu)
+
+    def receiveUDP(self):
         UDP_IP = "127.0.0.1"
         self.sock = socket.socket(socket.AF_INET, # Internet
         socket.SOCK_DGRAM) # UDP
-        self.sock.settimeout(1)
+        rcvbuf = int(self.expected_rate * receive_buffer_seconds * kernel_packet_size)
+        if rcvbuf > self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.sock.setblocking(0)
         self.sock.bind((UDP_IP, self.udp_port))
-        self.running = True
-        print "detectormanager started"
-        while self.running:
+        self.kernel_drops = self.readKernelDrops()
+        # one byte more than the largest accepted datagram to detect truncation
+        buf = bytearray(max_datagram_size + 1)
+        try:
+            while self.running:
+                readable, _, _ = select.select([self.sock], [], [], 1)
+                if readable:
+                    self.drain(buf)
+        finally:
+            self.sock.close()
+
+    def drain(self, buf):
+        """
+        Reads up to receive_batch_size datagrams that are queued on the socket without blocking
+        """
+        for i in xrange(receive_batch_size):
             try:
-                data, addr = self.sock.recvfrom(1024) # buffer size is 1024 bytes
-                for detector in self.detectors:
-                    detector.handle_packet(data)
-            except socket.timeout:
-                pass
+                nbytes = self.sock.recv_into(buf)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            self.received += 1
+            if nbytes > max_datagram_size:
+                self.truncated += 1
+                nbytes = max_datagram_size
+            self.dispatch(str(buf[:nbytes]))
+
+    def readKernelDrops(self):
+        """
+        Returns the number of datagrams the kernel dropped on the socket, read from /proc/net/udp.
+        Returns None if the counter is not available on this platform.
+        """
+        try:
+            inode = str(os.fstat(self.sock.fileno()).st_ino)
+            with open('/proc/net/udp') as udp_table:
+                for line in udp_table:
+                    fields = line.split()
+                    if len(fields) > 12 and fields[9] == inode:
+                        return int(fields[-1])
+        except (IOError, OSError, ValueError):
+            pass
+        return None
+
+    def saturated(self):
+        """
+        Returns True if every detector reached a verdict that further packets cannot change,
+        event driven detectors are left out as a benign cell may never send their event
+        """
+        waiting = [detector for detector in self.detectors if not detector.event_driven]
+        return len(waiting) > 0 and all(detector.saturated for detector in waiting)
+
+    def getStatistics(self):
+        return "received %d packets, %d truncated, %d dropped" % (self.received, self.truncated, self.dropped)
 
     def stop(self):
+        if self.kernel_drops is not None:
+            drops = self.readKernelDrops()
+            if drops is not None:
+                self.dropped += drops - self.kernel_drops
+                self.kernel_drops = drops
+        was_running = self.running
         self.running = False
-        self.sock.close()
+        # let the receive loop handle the frames that are still queued before ranking
+        if self.queue is not None:
+            if was_running:
+                self.finished.wait(5)
+            self.dropped += self.queue.dropped
+            self.queue.dropped = 0
         rankings = []
         for detector in self.detectors:
             rankings.append(detector.on_finish())
+        # the ingestion counters are no verdict, they are only printed
+        print "detectormanager %s" % self.getStatistics()
         return rankings
@@ -1,13 +1,14 @@
-from scapy.all import *
-from icc.gsmpackets import *
 from detector import Detector
+from icc.gsmdecoder import CIPHER_MODE_COMMAND_MESSAGE
 
 class A5Detector(Detector):
 
+    subscriptions = [CIPHER_MODE_COMMAND_MESSAGE]
+    event_driven = True
 
-    def handle_packet(self, data):
-        p = GSMTap(data)
-        if p.payload.name is 'LAPDm' and p.payload.payload.name is 'GSMAIFDTAP' and p.payload.payload.payload.name is 'CipherModeCommand':
+    def handle_packet(self, p):
+        if p.payload.name == 'LAPDm' and p.payload.payload.name == 'GSMAIFDTAP' and p.payload.payload.payload.name == 'CipherModeCommand':
+                self.saturated = True
                 if p.payload.payload.payload.cipher_mode & 1 == 0:
                     self.update_rank(Detector.SUSPICIOUS * 10, 'A5/0 detected! NO ENCRYPTION USED!')
                 else:
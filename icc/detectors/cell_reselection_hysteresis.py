@@ -1,15 +1,17 @@
 from detector import Detector
-from icc.gsmpackets import GSMTap
+from icc.gsmdecoder import SI3_MESSAGE
 
 cell_reselection_hysteresis_lower_threshold = 6  # db
 cell_reselection_hysteresis_upper_threshold = 9  # db
 
 
 class CellReselectionHysteresisDetector(Detector):
-    def handle_packet(self, data):
-        p = GSMTap(data)
-        if p.channel_type == 1 and p.payload.message_type == 0x1b:
+    subscriptions = [SI3_MESSAGE]
+
+    def handle_packet(self, p):
+        if p.channel_type == 1 and p.payload.name == 'BCCHCommon' and p.payload.payload.name == 'SystemInfoType3':
             sys_info3 = p.payload.payload
+            self.saturated = True
             cell_reselection_hysteresis = sys_info3.cell_reselection_hysteresis * 2
             if cell_reselection_hysteresis <= cell_reselection_hysteresis_lower_threshold:
                 self.update_rank(Detector.NOT_SUSPICIOUS, "low (%d dB) cell reselection hysteresis detected" % cell_reselection_hysteresis)
@@ -1,15 +1,17 @@
 from detector import Detector
-from icc.gsmpackets import GSMTap
+from icc.gsmdecoder import SI3_MESSAGE
 
 cell_reselection_offset_lower_threshold = 0  # db
 cell_reselection_offset_upper_threshold = 25  # db
 
 
 class CellReselectionOffsetDetector(Detector):
-    def handle_packet(self, data):
-        p = GSMTap(data)
-        if p.channel_type == 1 and p.payload.message_type == 0x1b:
+    subscriptions = [SI3_MESSAGE]
+
+    def handle_packet(self, p):
+        if p.channel_type == 1 and p.payload.name == 'BCCHCommon' and p.payload.payload.name == 'SystemInfoType3':
             sys_info3 = p.payload.payload
+            self.saturated = True
             if sys_info3.selection_parameters_present == 1:
                 cell_reselection_offset = sys_info3.cell_reselection_offset * 2
                 if cell_reselection_offset <= cell_reselection_offset_lower_threshold:
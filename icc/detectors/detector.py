@@ -1,5 +1,3 @@
-from scapy.all import *
-from icc.gsmpackets import *
 from multiprocessing import Process
 from icc.aux import TowerRank
 
@@ -10,6 +8,18 @@ class Detector:
     UNKNOWN = 1
     NOT_SUSPICIOUS = 0
 
+    # handle_packet receives the GSMTap packet decoded by the DetectorManager (see icc.gsmdecoder),
+    # set to False in a subclass to receive the raw GSMTap bytes instead
+    parsed = True
+
+    # (channel_type, control_field, message_type) keys of the messages the detector wants,
+    # see icc.gsmdecoder.peek. None subscribes the detector to every packet
+    subscriptions = None
+
+    # True for detectors whose verdict only changes on an event a benign cell may never send (e.g. a
+    # CipherModeCommand), the early stop of the analysis does not wait for them to saturate
+    event_driven = False
+
     def __init__(self, name, cellobs_id):
         """
         Parameters:
@@ -19,14 +29,16 @@ class Detector:
         self.comment = 'Not enough information found'
         self.cellobs_id = cellobs_id
         self.counter = 0
+        # set by the detector once further packets cannot change its verdict
+        self.saturated = False
 
     def update_rank(self, new_s_rank, new_comment):
         if new_s_rank >= self.s_rank:
             self.s_rank = new_s_rank
             self.comment = new_comment
 
-    def handle_packet(self, data):
-        print ':'.join(x.encode('hex') for x in data)
+    def handle_packet(self, packet):
+        print packet.name, packet.channel_type, packet.payload.name
 
     def on_finish(self):
         return TowerRank(self.s_rank, self.name, self.comment, self.cellobs_id)
@@ -40,6 +52,8 @@ class Detector:
             self.process.terminate()
 
 if __name__ == '__main__':
+        from scapy.all import hexdump
+        from icc.gsmpackets import GSMTap
         #parser = Parser(4729)
         #parser.listen()
         im_as_packet_dump = "02 04 01 00 03 f9 e2 00 00 1e 45 1d 02 00 04 00 2d 06 3f 10 0e 83 f9 7a c0 c5 02 00 c6 94 e0 a4 2b 2b 2b 2b 2b 2b 2b"
@@ -1,18 +1,21 @@
-from scapy.all import *
-from icc.gsmpackets import *
 from detector import Detector
+from icc.gsmdecoder import IDENTITY_REQUEST_MESSAGE
 
 
 class IDRequestDetector(Detector):
 
-    def handle_packet(self, data):
-        p = GSMTap(data)
-        if p.payload.name is 'LAPDm':
-            if p.payload.payload.name is 'GSMAIFDTAP':
-                if p.payload.payload.payload.name is 'IdentityRequest':
+    subscriptions = [IDENTITY_REQUEST_MESSAGE]
+    event_driven = True
+
+    def handle_packet(self, p):
+        if p.payload.name == 'LAPDm':
+            if p.payload.payload.name == 'GSMAIFDTAP':
+                if p.payload.payload.payload.name == 'IdentityRequest':
                     id_type = p.payload.payload.payload.id_type
                     if id_type == 1:
                         print 'IMSI request detected'
                         self.counter += 1
                         self.update_rank(Detector.UNKNOWN, 'IMSI request detected %s times' % self.counter)
+                        # UNKNOWN is the highest rank this detector assigns
+                        self.saturated = True
 
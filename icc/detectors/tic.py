@@ -1,55 +1,103 @@
 from detector import Detector
-from icc.gsmpackets import GSMTap
+from icc.gsmdecoder import SI3_MESSAGE
 
 import icc.cellinfochecks.query_cell_tower as CellTower
+from icc.aux.geo import calc_distance, out_of_range
 
-import math
+import Queue
+import threading
 
-def calc_distance(lat1, lon1, lat2, lon2):
-    # approximate radius of earth in km
-    R = 6373.0
+lookup_timeout = 5 # seconds on_finish waits for a pending tower lookup
 
-    rlat1 = math.radians(lat1)
-    rlon1 = math.radians(lon1)
-    rlat2 = math.radians(lat2)
-    rlon2 = math.radians(lon2)
 
-    dlon = rlon2 - rlon1
-    dlat = rlat2 - rlat1
+class TowerLookup(object):
+    """
+    Runs the opencellid lookups of the TIC detectors on a worker thread, so the receive loop never
+    blocks on the database. Concurrent lookups of the same (mcc, mnc, lac, cid) share one query,
+    repeated lookups are served by the cache of queryTower.
+    """
 
-    a = math.sin(dlat / 2) ** 2 + math.cos(rlat1) * math.cos(rlat2) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.requests = Queue.Queue()
+        self.worker = None
 
-    return (R * c) * 1000
+    def lookup(self, key, callback):
+        """
+        Calls callback with the list of towers found for key, or None if the lookup failed.
+        The callback is called on the worker thread.
+        """
+        with self.lock:
+            if key in self.pending:
+                self.pending[key].append(callback)
+                return
+            self.pending[key] = [callback]
+            self.requests.put(key)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.work)
+                self.worker.daemon = True
+                self.worker.start()
+
+    def work(self):
+        while True:
+            key = self.requests.get()
+            try:
+                towers = CellTower.queryTower(*key)
+            except Exception as e:
+                print "Tower lookup of %s failed: %s" % (key, e)
+                towers = None
+            with self.lock:
+                callbacks = self.pending.pop(key, [])
+            for callback in callbacks:
+                # a failing callback must not kill the worker, the lookups of the other detectors depend on it
+                try:
+                    callback(towers)
+                except Exception as e:
+                    print "Tower lookup callback of %s failed: %s" % (key, e)
+
+tower_lookup = TowerLookup()
 
 
 class TIC(Detector, object):
-    was_run = False
+    subscriptions = [SI3_MESSAGE]
 
     def __init__(self, name, cellobs_id, current_lat=52.2311057, current_lon=6.8553815, range_multiplier=1):
         super(self.__class__, self).__init__(name, cellobs_id)
         self.current_lat = current_lat
         self.current_lon = current_lon
         self.range_multiplier = range_multiplier
+        self.lookup_requested = False
+        self.lookup_done = threading.Event()
 
-    def handle_packet(self, data):
-        p = GSMTap(data)
-
-        if p.channel_type == 1 and p.payload.message_type == 0x1b:
+    def handle_packet(self, p):
+        if p.channel_type == 1 and p.payload.name == 'BCCHCommon' and p.payload.payload.name == 'SystemInfoType3':
             sys_info3 = p.payload.payload
 
-            if self.was_run:
+            if self.lookup_requested:
                 return
 
-            self.was_run = True
+            self.lookup_requested = True
+            tower_lookup.lookup((sys_info3.mcc, sys_info3.mnc, sys_info3.lac, sys_info3.cid), self.handle_towers)
 
-            towers = CellTower.queryTower(sys_info3.mcc, sys_info3.mnc, sys_info3.lac, sys_info3.cid)
-            if len(towers) > 0:
-                tower = towers[0]
-                distance = calc_distance(tower.lat, tower.lon, self.current_lat, self.current_lon)
-                if distance > (tower.range * self.range_multiplier):
-                    self.update_rank(Detector.UNKNOWN, "Cell tower found in database, but in wrong location %d m (range %d m)" % (distance, tower.range))
-                else:
-                    self.update_rank(Detector.NOT_SUSPICIOUS, "Cell tower found in database and is in range")
+    def handle_towers(self, towers):
+        if towers is None:
+            self.update_rank(Detector.UNKNOWN, "Tower lookup in database failed")
+        elif len(towers) > 0 and (self.current_lat is None or self.current_lon is None):
+            self.update_rank(Detector.UNKNOWN, "Cell tower found in database, but no location to compare with")
+        elif len(towers) > 0:
+            tower = towers[0]
+            distance = calc_distance(tower.lat, tower.lon, self.current_lat, self.current_lon)
+            if out_of_range(distance, tower.range, self.range_multiplier):
+                self.update_rank(Detector.UNKNOWN, "Cell tower found in database, but in wrong location %d m (range %d m)" % (distance, tower.range))
             else:
-                self.update_rank(Detector.UNKNOWN, "No match found in database")
+                self.update_rank(Detector.NOT_SUSPICIOUS, "Cell tower found in database and is in range")
+        else:
+            self.update_rank(Detector.UNKNOWN, "No match found in database")
+        self.saturated = True
+        self.lookup_done.set()
+
+    def on_finish(self):
+        if self.lookup_requested and not self.lookup_done.wait(lookup_timeout):
+            print "Tower lookup for %s did not finish in time" % self.name
+        return Detector.on_finish(self)
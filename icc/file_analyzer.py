@@ -13,14 +13,21 @@ import signal
 import sys
 import click
 
+from pdu_sink import pdu_queue_sink
+from wideband_analyzer import channel_filter
+
 """
 Block that reads a capture file.
 """
 
 class FileAnalyzer(gr.top_block):
 
-    def __init__(self, filename, samp_rate, arfcn, chan_mode='BCCH', udp_port=4000, max_timeslot=0, verbose=True, args="", connectToSelf=False):
+    def __init__(self, filename, samp_rate, arfcn, chan_mode='BCCH', udp_port=4000, pdu_queue=None, max_timeslot=0, verbose=True, args="", connectToSelf=False, center_freq=None):
         """
+        center_freq = frequency the capture is centered at if it is a wideband capture (see WidebandAnalyzer),
+                      the channel of the arfcn is filtered out of it. None if the capture is centered at the arfcn
+        udp_port = udp port on localhost to send the decoded GSMTap frames to, None disables the UDP client
+        pdu_queue = PDUQueue (e.g. DetectorManager.queue) to hand the decoded GSMTap frames to in-process
         """
 
         gr.top_block.__init__(self, "FileAnalyzer")
@@ -37,7 +44,9 @@ class FileAnalyzer(gr.top_block):
 
         self.samp_rate = samp_rate
         self.arfcn = arfcn
+        self.center_freq = center_freq
         self.udp_port = udp_port
+        self.pdu_queue = pdu_queue
         self.verbose = verbose
         self.cfile = filename.encode('utf-8')
         self.max_timeslot = max_timeslot
@@ -49,11 +58,15 @@ class FileAnalyzer(gr.top_block):
 
         self.file_source = blocks.file_source(gr.sizeof_gr_complex*1, self.cfile, False)
         self.receiver = grgsm.receiver(4, ([0]), ([]))
+        samp_rate_in = self.samp_rate
+        self.channel_filter = None
+        if self.center_freq is not None and self.fc is not None:
+            self.channel_filter, samp_rate_in = channel_filter(self.samp_rate, self.fc - self.center_freq)
         if self.fc is not None:
-            self.input_adapter = grgsm.gsm_input(ppm=0, osr=4, fc=self.fc, samp_rate_in=self.samp_rate)
+            self.input_adapter = grgsm.gsm_input(ppm=0, osr=4, fc=self.fc, samp_rate_in=samp_rate_in)
             self.offset_control = grgsm.clock_offset_control(self.fc)
         else:
-            self.input_adapter = grgsm.gsm_input(ppm=0, osr=4, samp_rate_in=self.samp_rate)
+            self.input_adapter = grgsm.gsm_input(ppm=0, osr=4, samp_rate_in=samp_rate_in)
 
         self.bursts_printer = grgsm.bursts_printer(pmt.intern(""), True, True, True, True)
 
@@ -97,11 +110,18 @@ class FileAnalyzer(gr.top_block):
             self.decoders.append(grgsm.control_channels_decoder())
 
 
-        #Server socket
-        if connectToSelf:
-            self.serversocket = blocks.socket_pdu("UDP_SERVER", "127.0.0.1", str(self.udp_port), 10000)
+        #Message sinks, the decoded packets are sent to all of them
+        self.pdu_sinks = []
+        if self.pdu_queue is not None:
+            self.pdu_sinks.append((pdu_queue_sink(self.pdu_queue), "msgs"))
+
+        if self.udp_port is not None:
+            #Server socket
+            if connectToSelf:
+                self.serversocket = blocks.socket_pdu("UDP_SERVER", "127.0.0.1", str(self.udp_port), 10000)
 
-        self.socket_pdu = blocks.socket_pdu("UDP_CLIENT", "127.0.0.1", str(self.udp_port), 10000)
+            self.socket_pdu = blocks.socket_pdu("UDP_CLIENT", "127.0.0.1", str(self.udp_port), 10000)
+            self.pdu_sinks.append((self.socket_pdu, "pdus"))
         if self.verbose:
             self.message_printer = grgsm.message_printer(pmt.intern(""), True, True, False)
 
@@ -111,7 +131,11 @@ class FileAnalyzer(gr.top_block):
         # Asynch Message Connections
         ##################################################
 
-        self.connect((self.file_source, 0), (self.input_adapter, 0))
+        if self.channel_filter is not None:
+            self.connect((self.file_source, 0), (self.channel_filter, 0))
+            self.connect((self.channel_filter, 0), (self.input_adapter, 0))
+        else:
+            self.connect((self.file_source, 0), (self.input_adapter, 0))
         self.connect((self.input_adapter, 0), (self.receiver, 0))
         if self.fc is not None:
             self.msg_connect(self.offset_control, "ppm", self.input_adapter, "ppm_in")
@@ -134,7 +158,8 @@ class FileAnalyzer(gr.top_block):
         #self.msg_connect(self.timeslot_filters[0], "out", self.control_demapper, "bursts")
         self.msg_connect(self.receiver, "C0", self.control_demapper, "bursts")
         self.msg_connect(self.control_demapper, "bursts", self.decoders[0], "bursts")
-        self.msg_connect(self.decoders[0], "msgs", self.socket_pdu, "pdus")
+        for sink, port in self.pdu_sinks:
+            self.msg_connect(self.decoders[0], "msgs", sink, port)
         if self.verbose:
             self.msg_connect(self.decoders[0], "msgs", self.message_printer, "msgs")
 
@@ -144,7 +169,8 @@ class FileAnalyzer(gr.top_block):
             self.msg_connect(self.receiver, "C0", self.other_demappers[i-1], "bursts")
             #self.msg_connect(self.timeslot_filters[i], "out", self.other_demappers[i - 1], "bursts")
             self.msg_connect(self.other_demappers[i - 1], "bursts", self.decoders[i], "bursts")
-            self.msg_connect(self.decoders[i], "msgs", self.socket_pdu, "pdus")
+            for sink, port in self.pdu_sinks:
+                self.msg_connect(self.decoders[i], "msgs", sink, port)
             if self.verbose:
                 self.msg_connect(self.decoders[i], "msgs", self.message_printer, "msgs")
 
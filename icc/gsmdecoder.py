@@ -0,0 +1,249 @@
+"""
+Fixed offset decoder for the GSMTap layers defined in gsmpackets.
+
+The layers expose the same names and fields as their scapy counterparts, but
+only decode the few bytes the detectors look at. Use gsmpackets (scapy) for
+debugging and hexdump output.
+"""
+import struct
+
+GSMTAP_HEADER = struct.Struct('>BBBBHBBIBBBB')
+LAPDM_HEADER = struct.Struct('>BBB')
+GSMAIFDTAP_HEADER = struct.Struct('>BB')
+COMMON_HEADER = struct.Struct('>HB')
+SYSTEM_INFO_TYPE_3 = struct.Struct('>H3BH3sBH3sB')
+SINGLE_BYTE = struct.Struct('>B')
+IMMEDIATE_ASSIGNMENT = struct.Struct('>BB')
+
+# (channel_type, control_field, message_type) routing keys returned by peek
+SI3_MESSAGE = (1, None, 0x1b)
+CIPHER_MODE_COMMAND_MESSAGE = (8, 32, 53)
+IDENTITY_REQUEST_MESSAGE = (8, 32, 24)
+
+CHANNEL_TYPE_OFFSET = 12
+ARFCN_OFFSET = 4
+ARFCN_MASK = 0x3fff # the upper bits flag PCS and uplink
+
+
+class Layer(object):
+    __slots__ = ('payload',)
+    name = None
+
+    def __init__(self):
+        self.payload = NO_PAYLOAD
+
+
+class NoPayload(Layer):
+    __slots__ = ()
+    name = "NoPayload"
+
+    def __init__(self):
+        pass
+
+    @property
+    def payload(self):
+        return self
+
+NO_PAYLOAD = NoPayload()
+
+
+class Raw(Layer):
+    __slots__ = ('load',)
+    name = "Raw"
+
+    def __init__(self, load):
+        Layer.__init__(self)
+        self.load = load
+
+
+class GSMTap(Layer):
+    __slots__ = ('version', 'header_length', 'payload_type', 'timeslot', 'arfcn', 'signal_level',
+                 'signal_noise_ratio', 'gsm_frame_number', 'channel_type', 'antenna_number', 'sub_slot', 'end_junk')
+    name = "GSMTap header"
+
+
+class LAPDm(Layer):
+    __slots__ = ('address_field', 'control_field', 'len_field')
+    name = "LAPDm"
+
+
+class GSMAIFDTAP(Layer):
+    __slots__ = ('rrmm', 'message_type')
+    name = "GSMAIFDTAP"
+
+
+class BCCHCommon(Layer):
+    __slots__ = ('junk1', 'message_type')
+    name = "BCCHCommon"
+
+
+class SystemInfoType3(Layer):
+    __slots__ = ('cid', 'mcc_0', 'mcc_1', 'mcc_2', 'mnc_0', 'mnc_1', 'mnc_2', 'lac', 'control_channel_description',
+                 'cell_options', 'cell_reselection_hysteresis', 'other_cell_selection_parameters',
+                 'rach_control_parameters', 'selection_parameters_present', 'cbq', 'cell_reselection_offset',
+                 'mcc', 'mnc')
+    name = "SystemInfoType3"
+
+
+class CipherModeCommand(Layer):
+    __slots__ = ('cipher_mode',)
+    name = "CipherModeCommand"
+
+
+class IdentityRequest(Layer):
+    __slots__ = ('id_type',)
+    name = "IdentityRequest"
+
+
+class CCCHCommon(Layer):
+    __slots__ = ('junk1', 'message_type')
+    name = "CCCHCommon"
+
+
+class ImmediateAssignment(Layer):
+    __slots__ = ('junk', 'packet_channel_description')
+    name = "ImmediateAssignment"
+
+
+def decode(data):
+    """
+    Decodes a GSMTap frame into a chain of layers linked through payload.
+    Returns None if data is shorter than the GSMTap header.
+    """
+    if len(data) < GSMTAP_HEADER.size:
+        return None
+    p = GSMTap()
+    (p.version, p.header_length, p.payload_type, p.timeslot, p.arfcn, p.signal_level, p.signal_noise_ratio,
+     p.gsm_frame_number, p.channel_type, p.antenna_number, p.sub_slot, p.end_junk) = GSMTAP_HEADER.unpack_from(data)
+
+    offset = GSMTAP_HEADER.size
+    if p.channel_type == 1:
+        p.payload = _decode_bcch(data, offset)
+    elif p.channel_type == 2:
+        p.payload = _decode_ccch(data, offset)
+    elif p.channel_type == 8:
+        p.payload = _decode_lapdm(data, offset)
+    else:
+        p.payload = _raw(data, offset)
+    return p
+
+
+def peek(data):
+    """
+    Reads the (channel_type, control_field, message_type) routing key of a GSMTap frame
+    without decoding it. Fields that do not apply to the channel type are None.
+    Returns None if data is too short to hold the key.
+    """
+    offset = GSMTAP_HEADER.size
+    try:
+        channel_type, = SINGLE_BYTE.unpack_from(data, CHANNEL_TYPE_OFFSET)
+        if channel_type == 8:
+            control_field, = SINGLE_BYTE.unpack_from(data, offset + 1)
+            if control_field != 32:
+                return (channel_type, control_field, None)
+            message_type, = SINGLE_BYTE.unpack_from(data, offset + LAPDM_HEADER.size + 1)
+            return (channel_type, control_field, message_type)
+        elif channel_type == 1 or channel_type == 2:
+            message_type, = SINGLE_BYTE.unpack_from(data, offset + 2)
+            return (channel_type, None, message_type)
+        return (channel_type, None, None)
+    except struct.error:
+        return None
+
+
+def _raw(data, offset):
+    if offset >= len(data):
+        return NO_PAYLOAD
+    return Raw(data[offset:])
+
+
+def _decode_lapdm(data, offset):
+    if len(data) < offset + LAPDM_HEADER.size:
+        return _raw(data, offset)
+    l = LAPDm()
+    l.address_field, l.control_field, l.len_field = LAPDM_HEADER.unpack_from(data, offset)
+    offset += LAPDM_HEADER.size
+    if l.control_field == 32:
+        l.payload = _decode_dtap(data, offset)
+    else:
+        l.payload = _raw(data, offset)
+    return l
+
+
+def _decode_dtap(data, offset):
+    if len(data) < offset + GSMAIFDTAP_HEADER.size:
+        return _raw(data, offset)
+    d = GSMAIFDTAP()
+    d.rrmm, d.message_type = GSMAIFDTAP_HEADER.unpack_from(data, offset)
+    offset += GSMAIFDTAP_HEADER.size
+    if d.message_type == 53 and len(data) > offset:
+        m = CipherModeCommand()
+        m.cipher_mode, = SINGLE_BYTE.unpack_from(data, offset)
+        m.payload = _raw(data, offset + 1)
+        d.payload = m
+    elif d.message_type == 24 and len(data) > offset:
+        m = IdentityRequest()
+        m.id_type, = SINGLE_BYTE.unpack_from(data, offset)
+        m.payload = _raw(data, offset + 1)
+        d.payload = m
+    else:
+        d.payload = _raw(data, offset)
+    return d
+
+
+def _decode_bcch(data, offset):
+    if len(data) < offset + COMMON_HEADER.size:
+        return _raw(data, offset)
+    b = BCCHCommon()
+    b.junk1, b.message_type = COMMON_HEADER.unpack_from(data, offset)
+    offset += COMMON_HEADER.size
+    if b.message_type == 0x1b and len(data) >= offset + SYSTEM_INFO_TYPE_3.size:
+        b.payload = _decode_si3(data, offset)
+    else:
+        b.payload = _raw(data, offset)
+    return b
+
+
+def _decode_si3(data, offset):
+    s = SystemInfoType3()
+    (s.cid, mcc_10, mnc_0_mcc_2, mnc_21, s.lac, ccd, s.cell_options, selection, rach,
+     offset_byte) = SYSTEM_INFO_TYPE_3.unpack_from(data, offset)
+    s.mcc_1 = mcc_10 >> 4
+    s.mcc_0 = mcc_10 & 0xf
+    s.mnc_0 = mnc_0_mcc_2 >> 4
+    s.mcc_2 = mnc_0_mcc_2 & 0xf
+    s.mnc_2 = mnc_21 >> 4
+    s.mnc_1 = mnc_21 & 0xf
+    s.control_channel_description = _uint24(ccd)
+    s.cell_reselection_hysteresis = selection >> 13
+    s.other_cell_selection_parameters = selection & 0x1fff
+    s.rach_control_parameters = _uint24(rach)
+    s.selection_parameters_present = offset_byte >> 7
+    s.cbq = (offset_byte >> 6) & 1
+    s.cell_reselection_offset = offset_byte & 0x3f
+    # same derivation as gsmpackets.SystemInfoType3.post_dissection
+    s.mcc = int(str(s.mcc_0) + str(s.mcc_1) + str(s.mcc_2))
+    s.mnc = int((str(s.mnc_0) if s.mnc_0 != 0xf else '') + str(s.mnc_1) + str(s.mnc_2))
+    s.payload = _raw(data, offset + SYSTEM_INFO_TYPE_3.size)
+    return s
+
+
+def _decode_ccch(data, offset):
+    if len(data) < offset + COMMON_HEADER.size:
+        return _raw(data, offset)
+    c = CCCHCommon()
+    c.junk1, c.message_type = COMMON_HEADER.unpack_from(data, offset)
+    offset += COMMON_HEADER.size
+    if c.message_type == 63 and len(data) >= offset + IMMEDIATE_ASSIGNMENT.size:
+        a = ImmediateAssignment()
+        a.junk, a.packet_channel_description = IMMEDIATE_ASSIGNMENT.unpack_from(data, offset)
+        a.payload = _raw(data, offset + IMMEDIATE_ASSIGNMENT.size)
+        c.payload = a
+    else:
+        c.payload = _raw(data, offset)
+    return c
+
+
+def _uint24(b):
+    b0, b1, b2 = struct.unpack('>3B', b)
+    return (b0 << 16) | (b1 << 8) | b2
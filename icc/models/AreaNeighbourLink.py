@@ -0,0 +1,22 @@
+from sqlalchemy import *
+from functools import partial
+from icc.database import Base
+
+from UUID import id_column
+
+# Prevents setting Not Null on each NotNullColumn
+NotNullColumn = partial(Column, nullable=False)
+
+
+# Neighbour edge between two cells of one area (mcc, mnc, lac), aggregated over all stored scans
+class AreaNeighbourLink(Base):
+    __tablename__ = 'areaneighbourlinks'
+    __table_args__ = (UniqueConstraint('mcc', 'mnc', 'lac', 'src_arfcn', 'dst_arfcn'),)
+    id = id_column()
+    mcc = NotNullColumn(Integer)
+    mnc = NotNullColumn(Integer)
+    lac = NotNullColumn(Integer)
+    src_arfcn = NotNullColumn(Integer)
+    dst_arfcn = NotNullColumn(Integer)
+    count = NotNullColumn(Integer, default=1) # number of scans in which the edge was seen
+    last_seen = NotNullColumn(DateTime(True))
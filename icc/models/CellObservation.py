@@ -21,7 +21,7 @@ class CellObservation(Base):
     # ccch_conf = ccch_conf
     power = NotNullColumn(Integer)
     s_rank = NotNullColumn(Integer, default=0)
-    # neighbours = neighbours
+    # neighbours are stored as NeighbourEdge rows, see neighbour_edges
     # cell_arfcns = cell_arfcns
     scan_id = NotNullColumn(UUID(), ForeignKey('scans.id'))
     scan = relationship("Scan", backref="cell_observations")
@@ -15,6 +15,10 @@ class CellTowerScan(Base):
     sample_rate = NotNullColumn(Float)
     rec_time_sec = NotNullColumn(Integer)
     timestamp = NotNullColumn(DateTime(True))
+    # set if the tower was recorded in a wideband capture shared with other towers (see WidebandAnalyzer),
+    # the file the samples are in and the frequency it is centered at
+    capture_file = Column(String)
+    center_freq = Column(Float)
     cellobservation_id = NotNullColumn(UUID(), ForeignKey('cellobservations.id'))
     cell_observation = relationship("CellObservation")
 
@@ -22,3 +26,8 @@ class CellTowerScan(Base):
         return "celltowerscan_{}-cellobservation_{}-samplerate_{}-timestamp_{}".format(self.id, self.cellobservation_id,
                                                                                        self.sample_rate,
                                                                                        self.timestamp.isoformat())
+
+    def getSamplesFileName(self):
+        if self.capture_file is not None:
+            return self.capture_file + ".cfile"
+        return self.getCaptureFileName() + ".cfile"
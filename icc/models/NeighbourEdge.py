@@ -0,0 +1,17 @@
+from sqlalchemy import *
+from sqlalchemy.orm import relationship
+from functools import partial
+from icc.database import Base
+
+from UUID import id_column, UUID
+
+# Prevents setting Not Null on each NotNullColumn
+NotNullColumn = partial(Column, nullable=False)
+
+
+class NeighbourEdge(Base):
+    __tablename__ = 'neighbouredges'
+    id = id_column()
+    arfcn = NotNullColumn(Integer) # arfcn of the neighbour cell announced by the observed cell
+    cellobservation_id = NotNullColumn(UUID(), ForeignKey('cellobservations.id'), index=True)
+    cell_observation = relationship("CellObservation", backref="neighbour_edges")
@@ -1,5 +1,7 @@
-__all__ = ['CellObservation', 'CellTowerScan', 'Scan']
+__all__ = ['CellObservation', 'CellTowerScan', 'Scan', 'NeighbourEdge', 'AreaNeighbourLink']
 
 from CellTowerScan import CellTowerScan
 from CellObservation import CellObservation
 from Scan import Scan
+from NeighbourEdge import NeighbourEdge
+from AreaNeighbourLink import AreaNeighbourLink
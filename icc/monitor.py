@@ -0,0 +1,174 @@
+"""
+Incremental monitoring of the cells around a location.
+
+Frequent cheap passes only scan the channels of the cells already known, from the last
+stored scan near the location or from earlier passes, plus a rotating slice of the other
+center frequencies of the bands. One in full_sweep_every passes sweeps the bands completely.
+Changes of the cells seen in a pass are reported as CellDiff.
+"""
+
+from collections import namedtuple
+
+import grgsm
+import time
+
+from aux.geo import bounding_box, haversine
+from models import Scan
+from scanner import center_frequencies
+import spectrum
+
+inventory_radius = 500 # meters around the location of the stored scan the inventory is taken from
+full_sweep_every = 10 # passes, every so many passes all center frequencies are scanned
+rotation_size = 2 # center frequencies of the bands scanned per pass besides the known cells
+power_threshold = 10 # dB, smaller power changes of a cell are not reported
+
+CellDiff = namedtuple('CellDiff', ['kind', 'arfcn', 'old', 'new'])
+
+
+def lastScanInventory(session, lat=None, lon=None, radius=inventory_radius):
+    """
+    Returns the cell observations of the most recent stored scan within radius meters of (lat, lon),
+    or of the most recent scan if no location is given
+    """
+    query = session.query(Scan).order_by(Scan.timestamp.desc())
+    if lat is not None and lon is not None:
+        dlat, dlon = bounding_box(lat, radius)
+        query = query.filter(Scan.latitude.between(lat - dlat, lat + dlat), Scan.longitude.between(lon - dlon, lon + dlon))
+    for scan in query:
+        if lat is None or lon is None or haversine(lat, lon, scan.latitude, scan.longitude) <= radius:
+            return list(scan.cell_observations)
+    return []
+
+
+def arfcn_steps(bands, channels_num):
+    """
+    Returns a dict from every arfcn of the bands to its (band, center frequency, channel) in the scan plan.
+    An arfcn of overlapping bands belongs to the first of them.
+    """
+    steps = {}
+    offsets = list(spectrum.channel_offsets(channels_num))
+    for band in bands:
+        for center_freq in center_frequencies(band, channels_num):
+            for chan, offset in enumerate(offsets):
+                arfcn = grgsm.arfcn.downlink2arfcn(center_freq + offset, band)
+                if arfcn is not None and arfcn not in steps:
+                    steps[arfcn] = (band, center_freq, chan)
+    return steps
+
+
+class Monitor(object):
+
+    def __init__(self, service, bands, inventory=[], full_sweep_every=full_sweep_every,
+                 rotation_size=rotation_size, power_threshold=power_threshold, adaptive_dwell=False):
+        self.service = service
+        self.bands = bands
+        self.full_sweep_every = full_sweep_every
+        self.rotation_size = rotation_size
+        self.power_threshold = power_threshold
+        self.adaptive_dwell = adaptive_dwell
+        self.passes = 0
+        # incremental passes since the last full sweep, without known cells the first pass is a full sweep
+        self.incremental_passes = 0 if inventory else full_sweep_every
+        # arfcn -> last ChannelInfo (or stored CellObservation) seen on it
+        self.inventory = dict((cell.arfcn, cell) for cell in inventory)
+        self.steps = arfcn_steps(bands, service.channels_num)
+        self.blocks = [(band, freq) for band in bands for freq in center_frequencies(band, service.channels_num)]
+        self.rotation = 0
+
+    def full_sweep_due(self):
+        return self.incremental_passes >= self.full_sweep_every - 1
+
+    def plan(self):
+        """
+        Returns the plan of the next pass for ScannerService.sweep, None for a full sweep
+        """
+        if self.full_sweep_due():
+            return None
+
+        masks = {}
+        for arfcn in self.inventory:
+            if arfcn in self.steps:
+                band, center_freq, chan = self.steps[arfcn]
+                mask = masks.setdefault((band, center_freq), set())
+                if mask is not None:
+                    mask.add(chan)
+        for i in xrange(min(self.rotation_size, len(self.blocks))):
+            masks[self.blocks[(self.rotation + i) % len(self.blocks)]] = None # all channels
+        self.rotation = (self.rotation + self.rotation_size) % max(len(self.blocks), 1)
+
+        frequencies = dict((band, []) for band in self.bands)
+        for (band, center_freq), mask in sorted(masks.iteritems()):
+            frequencies[band].append((center_freq, sorted(mask) if mask is not None else None))
+        return frequencies
+
+    def scanned_arfcns(self, frequencies):
+        if frequencies is None:
+            return set(self.steps)
+        scanned = set()
+        for arfcn, (band, center_freq, chan) in self.steps.iteritems():
+            for freq, mask in frequencies.get(band, []):
+                if freq == center_freq and (mask is None or chan in mask):
+                    scanned.add(arfcn)
+        return scanned
+
+    def diff(self, found_list, scanned):
+        """
+        Compares the cells found on the scanned arfcns with the inventory
+        """
+        diffs = []
+        found = dict((info.arfcn, info) for info in found_list)
+        for arfcn in sorted(scanned):
+            old, new = self.inventory.get(arfcn), found.get(arfcn)
+            if old is None and new is None:
+                continue
+            elif old is None:
+                diffs.append(CellDiff('new', arfcn, None, new))
+            elif new is None:
+                diffs.append(CellDiff('missing', arfcn, old, None))
+            elif (old.mcc, old.mnc, old.lac, old.cid) != (new.mcc, new.mnc, new.lac, new.cid):
+                diffs.append(CellDiff('changed', arfcn, old, new))
+            elif abs(new.power - old.power) > self.power_threshold:
+                diffs.append(CellDiff('power', arfcn, old, new))
+        return diffs
+
+    def run_pass(self):
+        """
+        Runs one pass, updates the inventory and returns the list of CellDiff
+        """
+        frequencies = self.plan()
+        found_list = self.service.sweep(self.bands, frequencies, self.adaptive_dwell)
+        scanned = self.scanned_arfcns(frequencies)
+        diffs = self.diff(found_list, scanned)
+        for d in diffs:
+            if d.kind == 'missing':
+                del self.inventory[d.arfcn]
+        for info in found_list:
+            self.inventory[info.arfcn] = info
+        self.passes += 1
+        self.incremental_passes = 0 if frequencies is None else self.incremental_passes + 1
+        return diffs
+
+    def run(self, interval=0, passes=0):
+        """
+        Runs a pass every interval seconds, passes times or forever if passes is 0, and prints the diffs
+        """
+        while passes == 0 or self.passes < passes:
+            start = time.time()
+            full = self.full_sweep_due()
+            diffs = self.run_pass()
+            print "Pass #%d (%s) took %.1f seconds, %d cells known, %d changes" % (
+                self.passes, "full sweep" if full else "incremental", time.time() - start, len(self.inventory), len(diffs))
+            for d in diffs:
+                print formatDiff(d)
+            time.sleep(max(0, interval - (time.time() - start)))
+
+
+def formatDiff(d):
+    if d.kind == 'new':
+        return "+ ARFCN: %4u new cell CID: %5u, LAC: %5u, MCC: %3u, MNC: %3u, Pwr: %3i" % (d.arfcn, d.new.cid, d.new.lac, d.new.mcc, d.new.mnc, d.new.power)
+    elif d.kind == 'missing':
+        return "- ARFCN: %4u cell CID: %5u, LAC: %5u disappeared" % (d.arfcn, d.old.cid, d.old.lac)
+    elif d.kind == 'changed':
+        return "! ARFCN: %4u cell changed from CID: %5u, LAC: %5u, MCC: %3u, MNC: %3u to CID: %5u, LAC: %5u, MCC: %3u, MNC: %3u" % (
+            d.arfcn, d.old.cid, d.old.lac, d.old.mcc, d.old.mnc, d.new.cid, d.new.lac, d.new.mcc, d.new.mnc)
+    return "~ ARFCN: %4u power changed from %3i to %3i" % (d.arfcn, d.old.power, d.new.power)
@@ -0,0 +1,54 @@
+from gnuradio import gr
+
+import pmt
+import threading
+
+from gsmdecoder import ARFCN_OFFSET, ARFCN_MASK
+
+
+class pdu_queue_sink(gr.basic_block):
+    """
+    Message sink that hands the decoded GSMTap frames of a flowgraph directly to a DetectorManager.
+    Every PDU received on the msgs port is offered to the bounded PDUQueue of the manager,
+    PDUs that do not fit are counted as dropped by the queue.
+    """
+
+    def __init__(self, queue):
+        gr.basic_block.__init__(self, name="PDU Queue Sink", in_sig=None, out_sig=None)
+        self.queue = queue
+        self.message_port_register_in(pmt.intern('msgs'))
+        self.set_msg_handler(pmt.intern('msgs'), self.handle_msg)
+
+    def handle_msg(self, msg):
+        self.queue.offer(str(bytearray(pmt.u8vector_elements(pmt.cdr(msg)))))
+
+
+class burst_counter(gr.basic_block):
+    """
+    Message sink that counts the bursts received on the bursts port per arfcn,
+    e.g. per channel of a wideband_receiver. Bursts only arrive from a channel
+    once its receiver found the frequency correction and synchronization bursts.
+    """
+
+    def __init__(self):
+        gr.basic_block.__init__(self, name="Burst Counter", in_sig=None, out_sig=None)
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.message_port_register_in(pmt.intern('bursts'))
+        self.set_msg_handler(pmt.intern('bursts'), self.handle_msg)
+
+    def handle_msg(self, msg):
+        burst = pmt.cdr(msg)
+        if pmt.length(burst) > ARFCN_OFFSET + 1:
+            # only read the arfcn of the GSMTap header instead of copying the whole burst
+            arfcn = ((pmt.u8vector_ref(burst, ARFCN_OFFSET) << 8) | pmt.u8vector_ref(burst, ARFCN_OFFSET + 1)) & ARFCN_MASK
+            with self.lock:
+                self.counts[arfcn] = self.counts.get(arfcn, 0) + 1
+
+    def get_channels(self):
+        with self.lock:
+            return self.counts.keys()
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
@@ -18,15 +18,19 @@ import random
 from multiprocessing import Process
 from threading import Thread
 import click
-from sqlalchemy import desc
+from sqlalchemy import desc, inspect
 
 from database import *
 from models import *
 from analyzer import Analyzer
+from wideband_analyzer import WidebandAnalyzer, AnalysisTarget, analysis_windows
 from detector_manager import DetectorManager
-from scanner import scan as sscan
+from scanner import scan as sscan, ScannerService
+from scan_coordinator import coordinated_scan, file_device_prefix
+from monitor import Monitor, lastScanInventory, full_sweep_every, rotation_size, power_threshold
 from cellinfochecks import *
 from aux.lat_log_utils import parse_dms
+from aux.flowgraph import run_until
 from detectors.detector import Detector
 from detectors.a5_detector import A5Detector
 from detectors.id_request_detector import IDRequestDetector
@@ -37,7 +41,7 @@ from cellinfochecks import TowerRank
 from icc.file_analyzer import FileAnalyzer
 
 class Runner():
-    def __init__(self, bands, sample_rate, ppm, gain, speed, rec_time_sec, current_location, store_capture):
+    def __init__(self, bands, sample_rate, ppm, gain, speed, rec_time_sec, current_location, store_capture, gsmtap_port=None, min_dwell_sec=2, pipeline=False, prescan=False, adaptive_dwell=False, devices=(), wideband_analysis=False):
         self.bands = bands
         self.sample_rate = sample_rate
         self.ppm = ppm
@@ -46,24 +50,55 @@ class Runner():
         self.scan_id = None
         self.rec_time_sec = rec_time_sec
         self.store_capture = store_capture
-
-    def start(self, lat=None, lon=None, analyze=True, detection=True, mute=True):
+        # optional udp port on localhost to also send the decoded GSMTap frames to, e.g. for Wireshark
+        self.udp_ports = [gsmtap_port] if gsmtap_port is not None else []
+        # the analysis of a tower stops early once all detectors are saturated, but not before min_dwell_sec
+        self.min_dwell_sec = min_dwell_sec
+        # decode the block of the previous center frequency while the next one is captured
+        self.pipeline = pipeline
+        # measure the power of every block first and only decode the blocks with a carrier
+        self.prescan = prescan
+        # stop recording a frequency once all synchronized channels produced their cell identity
+        self.adaptive_dwell = adaptive_dwell
+        # osmosdr device arguments of the SDRs to scan with, the bands are split over them if there are several
+        self.devices = list(devices)
+        # scanner kept open between scans, see scannerService
+        self.scanner_service = None
+        # analyze the towers that fit in one capture together, see analyzeMany
+        self.wideband_analysis = wideband_analysis
+
+    def start(self, lat=None, lon=None, analyze=True, detection=True, mute=True, interactive=True, keep_scanner=False):
+        """
+        keep_scanner = keep the scanner, and with it the device, open for the next scan (see daemon),
+                       unless the towers are analyzed
+        """
         db_session = session_class()
         found = self.doScan(lat, lon)
 
         s_ranks = []
 
+        if analyze or not keep_scanner:
+            # the analyzer opens the device itself
+            self.closeScannerService()
+
         random.shuffle(found)
+        to_analyze = []
         for i, ch in enumerate(found):
             cellobs = CellObservation(freq=ch.freq, lac=ch.lac, mnc=ch.mnc, mcc=ch.mcc, arfcn=ch.arfcn, cid=ch.cid, scan_id=self.scan_id, power=ch.power)
             if (self.store_capture):
                 db_session.add(cellobs)
+                for arfcn in set(ch.neighbours):
+                    db_session.add(NeighbourEdge(cell_observation=cellobs, arfcn=arfcn))
                 db_session.commit()
                 ch.cellobservation_id = cellobs.id
             else:
                 ch.cellobservation_id = ch.id = i
-            if analyze:
-                s_ranks += self.analyze(cellobs, detection=detection, mute=mute)
+            if analyze and self.wideband_analysis:
+                to_analyze.append(cellobs)
+            elif analyze:
+                s_ranks += self.analyze(cellobs, detection=detection, mute=mute, lat=lat, lon=lon)
+        if to_analyze:
+            s_ranks += self.analyzeMany(to_analyze, detection=detection, mute=mute, lat=lat, lon=lon)
 
         if self.store_capture:
             scan_obj = db_session.query(Scan).filter(Scan.id == self.scan_id).one()
@@ -72,6 +107,14 @@ class Runner():
             print "Performing offline checks..."
             s_ranks += self.doCellInfoChecks(lat, lon, found)
 
+        if self.store_capture:
+            # only the links leaving the cells found in this scan are updated
+            updateAreaGraph(db_session, found)
+
+        #Ranks that belong to no cell observation, e.g. expected towers that were not observed
+        scan_ranks = [s for s in s_ranks if s.cellobs_id is None]
+        s_ranks = [s for s in s_ranks if s.cellobs_id is not None]
+
         #Merge the ranks for each detector on cellobs_id
         obs_ranks = {}
         for s in s_ranks:
@@ -104,11 +147,14 @@ class Runner():
             if co.id in obs_ranks:
                 for tr in obs_ranks[co.id]:
                     print "--- Detector: {} | Rank: {} | Comment: {}".format(tr.detector, tr.s_rank, tr.comment)
-        if len(co_list) > 0:
+        for tr in scan_ranks:
+            print "Scan | Detector: {} | Rank: {} | Comment: {}".format(tr.detector, tr.s_rank, tr.comment)
+        if interactive and len(co_list) > 0:
             while click.confirm('Do you want to perform an additional scan on one of the displayed towers?'):
                 index = click.prompt('Enter the index of the cell tower you want to scan', type=int)
                 rec_time = click.prompt('Enter the scan duration in seconds', type=int)
                 self.rec_time_sec = rec_time
+                self.closeScannerService()
                 s_ranks = self.analyze(co_list[index], detection=detection, lat=lat, lon=lon)
 ################# PRINTING RANK
                 obs_ranks = {}
@@ -126,10 +172,86 @@ class Runner():
                         for tr in obs_ranks[co.id]:
                             print "--- Detector: {} | Rank: {} | Comment: {}".format(tr.detector, tr.s_rank, tr.comment)
 #################
+
+    def daemon(self, lat=None, lon=None, interval=0, sweeps=0, analyze=False, detection=True, mute=True):
+        """
+        Repeats the scan (and analysis) every interval seconds, sweeps times or forever if sweeps is 0.
+        Without analysis the scanner, and with it the device, stays open between the sweeps.
+        """
+        sweep = 0
+        try:
+            while sweeps == 0 or sweep < sweeps:
+                start = time.time()
+                sweep += 1
+                print "\nSweep #{}".format(sweep)
+                self.start(lat, lon, analyze=analyze, detection=detection, mute=mute, interactive=False, keep_scanner=True)
+                time.sleep(max(0, interval - (time.time() - start)))
+        except KeyboardInterrupt:
+            print "Stopped after {} sweeps".format(sweep)
+        finally:
+            self.closeScannerService()
+
+    def monitor(self, lat=None, lon=None, interval=0, passes=0, full_sweep_every=full_sweep_every, rotation_size=rotation_size, power_threshold=power_threshold):
+        """
+        Monitors the cells with incremental passes, see Monitor. The cells of the last stored scan
+        near (lat, lon) are verified from the first incremental pass on.
+        """
+        db_session = session_class()
+        inventory = lastScanInventory(db_session, lat, lon)
+        db_session.close()
+        print "Starting from {} cells of the last stored scan".format(len(inventory))
+
+        monitor = Monitor(self.scannerService(), self.bands, inventory, full_sweep_every=full_sweep_every,
+                          rotation_size=rotation_size, power_threshold=power_threshold, adaptive_dwell=self.adaptive_dwell)
+        try:
+            monitor.run(interval=interval, passes=passes)
+        except KeyboardInterrupt:
+            print "Stopped after {} passes".format(monitor.passes)
+        finally:
+            self.closeScannerService()
+
+    def deviceArgs(self):
+        """
+        osmosdr arguments of the device the scanner and the analyzers open, empty for the default device
+        """
+        return self.devices[0] if self.devices else ""
+
+    def scannerService(self):
+        """
+        Returns the scanner service, opening it (and the device) on first use
+        """
+        if self.scanner_service is None:
+            self.scanner_service = ScannerService(sample_rate=self.sample_rate, ppm=self.ppm, speed=self.speed, args=self.deviceArgs())
+        return self.scanner_service
+
+    def closeScannerService(self):
+        if self.scanner_service is not None:
+            self.scanner_service.close()
+            self.scanner_service = None
+
     def doCellInfoChecks(self, lat, lon, channel_infos=[]):
-        ranks = tic(channel_infos,lat,lon) + lac(channel_infos) + neighbours(channel_infos)
+        expected = loadTowerGrid(lat, lon).expected(lat, lon)
+        baseline = None
+        mesh = None
+        if self.store_capture:
+            # judge the local area codes and the neighbour lists against the past scans as well
+            db_session = session_class()
+            baseline = lacBaseline(db_session, lat, lon, exclude_scan_id=self.scan_id)
+            mesh = loadAreaMesh(db_session, [areaKey(info) for info in channel_infos])
+            db_session.close()
+        ranks = tic(channel_infos,lat,lon, expected=expected) + lac(channel_infos, expected=expected, baseline=baseline) + neighbours(channel_infos, mesh)
         return ranks
 
+    def createDetectorManager(self, cellobs_id, lat=None, lon=None):
+        detector_man = DetectorManager()
+        #detector_man.addDetector(Detector('test_detector', cellobs_id))
+        detector_man.addDetector(A5Detector('a5_detector', cellobs_id))
+        detector_man.addDetector(IDRequestDetector('id_request_detector', cellobs_id))
+        detector_man.addDetector(CellReselectionOffsetDetector('cell_reselection_offset_detector', cellobs_id))
+        detector_man.addDetector(CellReselectionHysteresisDetector('cell_reselection_offset_hysteresis', cellobs_id))
+        detector_man.addDetector(TIC('tic', cellobs_id, lat, lon))
+        return detector_man
+
     def analyze(self, cell_obs, detection=True, mute=True, lat=None, lon=None):
         print "analyzing"
         cellobs_id = cell_obs.id
@@ -139,15 +261,8 @@ class Runner():
             db_session = session_class()
             db_session.add(cellscan)
             db_session.commit()
-        udp_port = 2333
         if detection:
-            detector_man = DetectorManager(udp_port=udp_port)
-            #detector_man.addDetector(Detector('test_detector', cellobs_id))
-            detector_man.addDetector(A5Detector('a5_detector', cellobs_id))
-            detector_man.addDetector(IDRequestDetector('id_request_detector', cellobs_id))
-            detector_man.addDetector(CellReselectionOffsetDetector('cell_reselection_offset_detector', cellobs_id))
-            detector_man.addDetector(CellReselectionHysteresisDetector('cell_reselection_offset_hysteresis', cellobs_id))
-            detector_man.addDetector(TIC('tic', cellobs_id, lat, lon))
+            detector_man = self.createDetectorManager(cellobs_id, lat, lon)
             proc = Thread(target=detector_man.start)
             proc.start()
             if mute:
@@ -161,11 +276,10 @@ class Runner():
                 os.dup2(null_fds[1], 2)
             analyzer = Analyzer(gain=self.gain, samp_rate=self.sample_rate,
                                 ppm=self.ppm, arfcn=cell_obs.arfcn, capture_id=cellscan.getCaptureFileName(),
-                                udp_ports=[udp_port], rec_length=self.rec_time_sec, max_timeslot=2,
-                                verbose=False, test=False, store_capture=self.store_capture)
-            analyzer.start()
-            analyzer.wait()
-            analyzer.stop()
+                                pdu_queues=[detector_man.queue], udp_ports=self.udp_ports, rec_length=self.rec_time_sec,
+                                max_timeslot=2, verbose=False, test=False, store_capture=self.store_capture,
+                                args=self.deviceArgs())
+            rec_time = run_until(analyzer, detector_man.saturated, self.min_dwell_sec)
             if mute:
                 # restore file descriptors so we can print the results
                 os.dup2(save[0], 1)
@@ -174,7 +288,7 @@ class Runner():
                 os.close(null_fds[0])
                 os.close(null_fds[1])
 
-            print "analyzer stopped"
+            print "analyzer stopped after %.1f seconds" % rec_time
             s_ranks = detector_man.stop()
             print "detector stopping..."
 
@@ -198,8 +312,8 @@ class Runner():
             os.dup2(null_fds[1], 2)
             analyzer = Analyzer(gain=self.gain, samp_rate=self.sample_rate,
                                 ppm=self.ppm, arfcn=cell_obs.arfcn, capture_id=cellscan.getCaptureFileName(),
-                                udp_ports=[udp_port], rec_length=self.rec_time_sec, max_timeslot=2,
-                                verbose=False, test=True)
+                                udp_ports=self.udp_ports, rec_length=self.rec_time_sec, max_timeslot=2,
+                                verbose=False, test=True, args=self.deviceArgs())
             analyzer.start()
             analyzer.wait()
             analyzer.stop()
@@ -213,6 +327,77 @@ class Runner():
 
         return s_ranks
 
+    def analyzeMany(self, cell_obs_list, detection=True, mute=True, lat=None, lon=None):
+        """
+        Analyzes the cell towers from wideband captures instead of one narrowband capture per tower.
+        The towers are grouped into windows of the sample rate, every window is recorded once and
+        each tower in it is decoded in parallel with its own detectors.
+        """
+        s_ranks = []
+        by_arfcn = {}
+        for cell_obs in cell_obs_list:
+            by_arfcn.setdefault(cell_obs.arfcn, []).append(cell_obs)
+
+        for center_freq, arfcns in analysis_windows(by_arfcn.keys(), self.sample_rate):
+            print "analyzing {} towers around {:.1f} MHz".format(sum(len(by_arfcn[arfcn]) for arfcn in arfcns), center_freq / 1e6)
+            timestamp = datetime.datetime.now()
+            capture_id = "window_{:.0f}-samplerate_{}-timestamp_{}".format(center_freq, self.sample_rate, timestamp.isoformat())
+            targets = []
+            managers = []
+            threads = []
+            for arfcn in arfcns:
+                for cell_obs in by_arfcn[arfcn]:
+                    # the samples of all towers of the window are in one file centered at center_freq
+                    cellscan = CellTowerScan(cellobservation_id=cell_obs.id, sample_rate=self.sample_rate, rec_time_sec=self.rec_time_sec, timestamp=timestamp,
+                                             capture_file=capture_id, center_freq=center_freq)
+                    if self.store_capture:
+                        db_session = session_class()
+                        db_session.add(cellscan)
+                        db_session.commit()
+                    pdu_queues = []
+                    if detection:
+                        # the frames of this arfcn only reach the detectors of this cell observation
+                        detector_man = self.createDetectorManager(cell_obs.id, lat, lon)
+                        managers.append(detector_man)
+                        threads.append(Thread(target=detector_man.start))
+                        pdu_queues.append(detector_man.queue)
+                    targets.append(AnalysisTarget(arfcn, pdu_queues, cellscan.getCaptureFileName()))
+            for proc in threads:
+                proc.start()
+
+            if mute:
+                # silence rtl_sdr output:
+                # open 2 fds
+                null_fds = [os.open(os.devnull, os.O_RDWR) for x in xrange(2)]
+                # save the current file descriptors to a tuple
+                save = os.dup(1), os.dup(2)
+                # put /dev/null fds on 1 and 2
+                os.dup2(null_fds[0], 1)
+                os.dup2(null_fds[1], 2)
+            analyzer = WidebandAnalyzer(gain=self.gain, samp_rate=self.sample_rate, ppm=self.ppm,
+                                        center_freq=center_freq, targets=targets,
+                                        capture_id=capture_id,
+                                        udp_ports=self.udp_ports, rec_length=self.rec_time_sec, max_timeslot=2,
+                                        store_capture=self.store_capture, args=self.deviceArgs())
+            # the window is done once every tower in it reached its verdict
+            rec_time = run_until(analyzer, lambda: managers and all(m.saturated() for m in managers), self.min_dwell_sec)
+            if mute:
+                # restore file descriptors so we can print the results
+                os.dup2(save[0], 1)
+                os.dup2(save[1], 2)
+                # close the temporary fds
+                os.close(null_fds[0])
+                os.close(null_fds[1])
+
+            print "analyzer stopped after %.1f seconds" % rec_time
+            for detector_man in managers:
+                s_ranks += detector_man.stop()
+            for proc in threads:
+                proc.join()
+            print "detectors stopped"
+
+        return s_ranks
+
 
     def doScan(self, lat=None, lon=None):
         """
@@ -226,7 +411,14 @@ class Runner():
             db_session.add(scan_obj)
             db_session.commit()
             self.scan_id = scan_obj.id
-        return sscan(bands=self.bands, sample_rate=self.sample_rate, ppm=self.ppm, gain=self.gain, speed=self.speed)
+        if len(self.devices) > 1 or any(device.startswith(file_device_prefix) for device in self.devices):
+            # every device scans a part of the bands in its own process
+            return coordinated_scan(self.devices, bands=self.bands, sample_rate=self.sample_rate, ppm=self.ppm, speed=self.speed, adaptive_dwell=self.adaptive_dwell)
+        if self.pipeline or self.prescan:
+            # these open the device themselves
+            self.closeScannerService()
+            return sscan(bands=self.bands, sample_rate=self.sample_rate, ppm=self.ppm, gain=self.gain, speed=self.speed, pipeline=self.pipeline, prescan_bands=self.prescan, adaptive_dwell=self.adaptive_dwell, args=self.deviceArgs())
+        return sscan(bands=self.bands, sample_rate=self.sample_rate, ppm=self.ppm, gain=self.gain, speed=self.speed, adaptive_dwell=self.adaptive_dwell, service=self.scannerService())
 
 def offlineDetection(chan_mode, timeslot):
     db_session = session_class()
@@ -263,8 +455,7 @@ def offlineDetection(chan_mode, timeslot):
             continue
         selected_cts = selected_obs.celltowerscans[index3]
 
-        udp_port = 2333
-        detector_man = DetectorManager(udp_port=udp_port)
+        detector_man = DetectorManager()
         #detector_man.addDetector(Detector('test_detector', cellobs_id))
         detector_man.addDetector(A5Detector('a5_detector', selected_obs.id))
         detector_man.addDetector(IDRequestDetector('id_request_detector', selected_obs.id))
@@ -275,8 +466,8 @@ def offlineDetection(chan_mode, timeslot):
         proc = Thread(target=detector_man.start)
         proc.start()
 
-        print "Selected file: {}".format(selected_cts.getCaptureFileName())
-        fa = FileAnalyzer(selected_cts.getCaptureFileName() +".cfile", cts.sample_rate, cts.cell_observation.arfcn, max_timeslot=timeslot, chan_mode=chan_mode, udp_port=udp_port, verbose=True)
+        print "Selected file: {}".format(selected_cts.getSamplesFileName())
+        fa = FileAnalyzer(selected_cts.getSamplesFileName(), selected_cts.sample_rate, selected_cts.cell_observation.arfcn, max_timeslot=timeslot, chan_mode=chan_mode, udp_port=None, pdu_queue=detector_man.queue, verbose=True, center_freq=selected_cts.center_freq)
         fa.start()
         fa.wait()
         fa.stop()
@@ -318,3 +509,21 @@ def listScans(limit, printscans):
 
 def createDatabase():
     Base.metadata.create_all(engine)
+    addMissingColumns()
+
+def addMissingColumns():
+    """
+    create_all only creates missing tables, columns that were added to the models later
+    (e.g. celltowerscans.capture_file) are added to the existing tables here
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = set(column['name'] for column in inspector.get_columns(table.name))
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                print "Column {}.{} is missing and can not be added to the existing table, recreate the database".format(table.name, column.name)
+                continue
+            print "Adding column {}.{}".format(table.name, column.name)
+            engine.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table.name, column.name, column.type.compile(dialect=engine.dialect)))
@@ -0,0 +1,92 @@
+"""
+Splits the scan of the bands over several SDRs, one scanner process per device.
+
+A device is given by its osmosdr device arguments, e.g. "rtl=0". A device "file:<directory>"
+stands in for an SDR with the blocks recorded by scanner.record in that directory.
+"""
+
+from multiprocessing import Pool
+
+import json
+import os
+
+from scanner import ScannerService, wideband_file_decoder, extract_channel_infos, scan_plan, manifest_file
+
+file_device_prefix = 'file:'
+
+
+def split_plan(bands, channels_num, devices_num, frequencies=None):
+    """
+    Returns a list per device of the (band, center frequency, channel mask) steps it should scan.
+    The steps of all bands are dealt out in turn, so every device gets a part of every band.
+    """
+    steps = [(band, freq, channel_mask) for band in bands for freq, channel_mask in scan_plan(band, channels_num, frequencies)]
+    return [steps[i::devices_num] for i in xrange(devices_num)]
+
+
+def scan_file_device(directory, steps, sample_rate):
+    """
+    Scans the steps from the blocks recorded in directory, the steps that were not recorded are skipped.
+    The blocks are decoded at the sample rate of the recording, which has to give the same number of
+    channels per block as the sample_rate the steps were planned with.
+    """
+    with open(os.path.join(directory, manifest_file)) as f:
+        manifest = json.load(f)
+    files = dict(((block['band'], block['center_frequency']), block['file']) for block in manifest['blocks'])
+    channels_num = int(manifest['sample_rate']/0.2e6)
+    if channels_num != int(sample_rate/0.2e6):
+        raise ValueError("%s was recorded at %.1f MHz, the scan is planned for %.1f MHz" % (
+            directory, manifest['sample_rate'] / 1e6, sample_rate / 1e6))
+    sample_rate = manifest['sample_rate']
+
+    found_list = []
+    decoder = wideband_file_decoder(sample_rate=sample_rate)
+    for band, current_freq, channel_mask in steps:
+        if (band, current_freq) not in files:
+            print "No block recorded for %s at %.1f MHz in %s" % (band, current_freq / 1e6, directory)
+            continue
+        decoder.decode(os.path.join(directory, files[(band, current_freq)]), current_freq, channel_mask)
+        found_list += extract_channel_infos(decoder.gsm_extract_system_info, current_freq, channels_num, band)
+    return found_list
+
+
+def scan_device(job):
+    """
+    Scans the steps of one device, runs in the process of that device
+    """
+    device, steps, sample_rate, ppm, speed, adaptive_dwell = job
+    if device.startswith(file_device_prefix):
+        return scan_file_device(device[len(file_device_prefix):], steps, sample_rate)
+
+    service = ScannerService(sample_rate=sample_rate, ppm=ppm, speed=speed, args=device)
+    found_list = []
+    try:
+        for band, current_freq, channel_mask in steps:
+            found_list += service.step(band, current_freq, channel_mask, adaptive_dwell)
+    finally:
+        service.close()
+    return found_list
+
+
+def coordinated_scan(devices, bands=[], sample_rate=2e6, ppm=0, speed=4, adaptive_dwell=False, frequencies=None):
+    """
+    Scans the bands with all devices in parallel, every device in its own process,
+    and returns the merged ChannelInfo lists like scanner.scan
+    """
+    channels_num = int(sample_rate/0.2e6)
+    plans = split_plan(bands, channels_num, len(devices), frequencies)
+    jobs = [(device, steps, sample_rate, ppm, speed, adaptive_dwell) for device, steps in zip(devices, plans)]
+    for device, steps in zip(devices, plans):
+        print "Device %s scans %d frequencies" % (device, len(steps))
+
+    pool = Pool(len(devices))
+    try:
+        results = pool.map(scan_device, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    found_list = []
+    for result in results:
+        found_list += result
+    return found_list
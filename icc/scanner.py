@@ -31,16 +31,31 @@ from math import pi
 from optparse import OptionParser
 
 import grgsm
+import json
 import numpy
 import os
 import osmosdr
 import pmt
+import Queue
+import shutil
+import tempfile
+import threading
 import time
 
 from aux import ChannelInfo
+from aux.flowgraph import run_until
+from pdu_sink import burst_counter
+import spectrum
 
 #from wideband_receiver import *
 
+pipeline_queue_size = 2 # captured blocks waiting to be decoded, bounds the memory used by a pipelined scan
+decode_workers = 2 # number of blocks decoded in parallel by a pipelined scan
+prescan_time = 0.05 # seconds of samples recorded per center frequency by the power pre-scan
+settle_time = 0.01 # seconds of samples dropped after tuning, before the pre-scan measures
+manifest_file = 'manifest.json' # describes the blocks recorded by record
+min_dwell = 1.0 # seconds an adaptive scan records at least per center frequency, many FCCH periods
+
 class receiver_with_decoder(grgsm.hier_block):
 
     def __init__(self, OSR=4, chan_num=0, fc=939.4e6, ppm=0, samp_rate=0.2e6):
@@ -139,7 +154,7 @@ class receiver_with_decoder(grgsm.hier_block):
 
 class wideband_receiver(grgsm.hier_block):
 
-    def __init__(self, OSR=4, fc=939.4e6, samp_rate=0.4e6):
+    def __init__(self, OSR=4, fc=939.4e6, samp_rate=0.4e6, channel_mask=None):
         grgsm.hier_block.__init__(
             self, "Wideband receiver",
             gr.io_signature(1, 1, gr.sizeof_gr_complex*1),
@@ -147,9 +162,9 @@ class wideband_receiver(grgsm.hier_block):
         )
         self.message_port_register_hier_out("bursts")
         self.message_port_register_hier_out("msgs")
-        self.__init(OSR, fc, samp_rate)
+        self.__init(OSR, fc, samp_rate, channel_mask)
 
-    def __init(self, OSR=4, fc=939.4e6, samp_rate=0.4e6):
+    def __init(self, OSR=4, fc=939.4e6, samp_rate=0.4e6, channel_mask=None):
         ##################################################
         # Parameters
         ##################################################
@@ -158,6 +173,8 @@ class wideband_receiver(grgsm.hier_block):
         self.samp_rate = samp_rate
         self.channels_num = int(samp_rate/0.2e6)
         self.OSR_PFB = 2
+        # channels (outputs of the channelizer) that are decoded, the others end in a null sink
+        self.channel_mask = self.__channel_set(channel_mask)
 
         ##################################################
         # Blocks
@@ -168,6 +185,7 @@ class wideband_receiver(grgsm.hier_block):
             self.OSR_PFB,
             100)
         self.pfb_channelizer_ccf_0.set_channel_map(([]))
+        self.null_sinks = {}
         self.create_receivers()
 
         ##################################################
@@ -175,14 +193,60 @@ class wideband_receiver(grgsm.hier_block):
         ##################################################
         self.connect((self, 0), (self.pfb_channelizer_ccf_0, 0))
         for chan in xrange(0,self.channels_num):
-            self.connect((self.pfb_channelizer_ccf_0, chan), (self.receivers_with_decoders[chan], 0))
-            self.msg_connect(self.receivers_with_decoders[chan], 'bursts', self, 'bursts')
-            self.msg_connect(self.receivers_with_decoders[chan], 'msgs', self, 'msgs')
+            self.connect_channel(chan)
+
+    def __channel_set(self, channel_mask):
+        if channel_mask is None:
+            return set(xrange(0,self.channels_num))
+        return set(int(chan) for chan in channel_mask if 0 <= chan < self.channels_num)
 
     def create_receivers(self):
         self.receivers_with_decoders = {}
-        for chan in xrange(0,self.channels_num):
-            self.receivers_with_decoders[chan] = receiver_with_decoder(fc=self.fc, OSR=self.OSR, chan_num=chan, samp_rate=self.OSR_PFB*0.2e6)
+        for chan in self.channel_mask:
+            self.receivers_with_decoders[chan] = self.create_receiver(chan)
+
+    def create_receiver(self, chan):
+        return receiver_with_decoder(fc=self.fc, OSR=self.OSR, chan_num=chan, samp_rate=self.OSR_PFB*0.2e6)
+
+    def connect_channel(self, chan):
+        if chan in self.channel_mask:
+            self.connect((self.pfb_channelizer_ccf_0, chan), (self.receivers_with_decoders[chan], 0))
+            self.msg_connect(self.receivers_with_decoders[chan], 'bursts', self, 'bursts')
+            self.msg_connect(self.receivers_with_decoders[chan], 'msgs', self, 'msgs')
+        else:
+            if chan not in self.null_sinks:
+                self.null_sinks[chan] = blocks.null_sink(gr.sizeof_gr_complex*1)
+            self.connect((self.pfb_channelizer_ccf_0, chan), (self.null_sinks[chan], 0))
+
+    def disconnect_channel(self, chan):
+        if chan in self.channel_mask:
+            self.disconnect((self.pfb_channelizer_ccf_0, chan), (self.receivers_with_decoders[chan], 0))
+            self.msg_disconnect(self.receivers_with_decoders[chan], 'bursts', self, 'bursts')
+            self.msg_disconnect(self.receivers_with_decoders[chan], 'msgs', self, 'msgs')
+        else:
+            self.disconnect((self.pfb_channelizer_ccf_0, chan), (self.null_sinks[chan], 0))
+
+    def get_channel_mask(self):
+        return sorted(self.channel_mask)
+
+    def set_channel_mask(self, channel_mask):
+        """
+        Only decodes the given channels from now on (None = all channels). The receivers of
+        channels that are masked out are kept, so masking them in again is cheap.
+        """
+        channel_mask = self.__channel_set(channel_mask)
+        changed = self.channel_mask ^ channel_mask
+        if not changed:
+            return
+        self.lock()
+        for chan in changed:
+            self.disconnect_channel(chan)
+        self.channel_mask = channel_mask
+        for chan in changed:
+            if chan in channel_mask and chan not in self.receivers_with_decoders:
+                self.receivers_with_decoders[chan] = self.create_receiver(chan)
+            self.connect_channel(chan)
+        self.unlock()
 
     def get_OSR(self):
         return self.OSR
@@ -196,8 +260,8 @@ class wideband_receiver(grgsm.hier_block):
 
     def set_fc(self, fc):
         self.fc = fc
-        for chan in xrange(0,self.channels_num):
-            self.receivers_with_decoders[chan].set_fc(fc)
+        for receiver in self.receivers_with_decoders.itervalues():
+            receiver.set_fc(fc)
 
     def get_samp_rate(self):
         return self.samp_rate
@@ -242,81 +306,460 @@ class wideband_scanner(gr.top_block):
 
         self.wideband_receiver = wideband_receiver(OSR=4, fc=carrier_frequency, samp_rate=sample_rate)
         self.gsm_extract_system_info = grgsm.extract_system_info()
+        self.burst_counter = burst_counter()
 
 
         self.connect((self.rtlsdr_source, 0), (self.head, 0))
         self.connect((self.head, 0), (self.blocks_rotator_cc, 0))
         self.connect((self.blocks_rotator_cc, 0), (self.wideband_receiver,0))
         self.msg_connect(self.wideband_receiver, 'msgs', self.gsm_extract_system_info, 'msgs')
+        self.msg_connect(self.wideband_receiver, 'bursts', self.burst_counter, 'bursts')
 
     def set_carrier_frequency(self, carrier_frequency):
         self.carrier_frequency = carrier_frequency
         self.rtlsdr_source.set_center_freq(carrier_frequency - 0.1e6, 0)
         self.wideband_receiver.set_fc(carrier_frequency)
 
-def scan(bands=[], sample_rate=2e6, ppm=0, gain=30.0, speed=4):
+    def set_channel_mask(self, channel_mask):
+        self.wideband_receiver.set_channel_mask(channel_mask)
+
+    def set_rec_len(self, rec_len):
+        self.rec_len = rec_len
+        self.head.set_length(int(rec_len * self.sample_rate))
+
+    def pending_channels(self):
+        """
+        Returns the channels that synchronized (their receiver passes bursts) but did not yet
+        produce the cell identity (cell ID, LAC, MCC, MNC from system information type 3/4)
+        """
+        chans = self.gsm_extract_system_info.get_chans()
+        mccs = self.gsm_extract_system_info.get_mcc()
+        identified = set(chan for chan, mcc in zip(chans, mccs) if mcc)
+        return set(self.burst_counter.get_channels()) - identified
+
+def center_frequencies(band, channels_num):
+    """
+    Returns the center frequencies that cover the band with channels_num channels each
+    """
+    first_arfcn = grgsm.arfcn.get_first_arfcn(band)
+    last_arfcn = grgsm.arfcn.get_last_arfcn(band)
+    last_center_arfcn = last_arfcn - int((channels_num / 2) - 1)
+
+    current_freq = grgsm.arfcn.arfcn2downlink(first_arfcn + int(channels_num / 2) - 1, band)
+    last_freq = grgsm.arfcn.arfcn2downlink(last_center_arfcn, band)
+    stop_freq = last_freq + 0.2e6 * channels_num
 
+    freqs = []
+    while current_freq < stop_freq:
+        freqs.append(current_freq)
+        current_freq += channels_num * 0.2e6
+    return freqs
+
+def extract_channel_infos(system_info, current_freq, channels_num, band):
+    """
+    Returns the ChannelInfo of every cell found by the extract_system_info block
+    in the block captured at current_freq
+    """
     found_list = []
-    channels_num = int(sample_rate/0.2e6)
-    arfcn_list = dict()
+    freq_offsets = numpy.fft.ifftshift(numpy.array(range(int(-numpy.floor(channels_num/2)),int(numpy.floor((channels_num+1)/2))))*2e5)
+    detected_c0_channels = system_info.get_chans()
+
+    if detected_c0_channels:
+        chans = numpy.array(system_info.get_chans())
+        found_freqs = current_freq + freq_offsets[(chans)]
+
+        cell_ids = numpy.array(system_info.get_cell_id())
+        lacs = numpy.array(system_info.get_lac())
+        mccs = numpy.array(system_info.get_mcc())
+        mncs = numpy.array(system_info.get_mnc())
+        ccch_confs = numpy.array(system_info.get_ccch_conf())
+        powers = numpy.array(system_info.get_pwrs())
+
+
+        for i in range(0, len(chans)):
+            cell_arfcn_list = system_info.get_cell_arfcns(chans[i])
+            neighbour_list = system_info.get_neighbours(chans[i])
+
+            info = ChannelInfo(grgsm.arfcn.downlink2arfcn(found_freqs[i], band), found_freqs[i], cell_ids[i], lacs[i], mccs[i], mncs[i], ccch_confs[i], powers[i], neighbour_list, cell_arfcn_list)
+
+            if info.arfcn:
+                found_list.append(info)
+                print info.arfcn
+            else:
+                print 'Skipping `None`...'
+    return found_list
+
+class wideband_capture(gr.top_block):
+    """
+    Records rec_len seconds of IQ samples around a center frequency to a file,
+    the capture stage of a pipelined scan
+    """
+
+    def __init__(self, rec_len=3, sample_rate=2e6, ppm=0, args=""):
+
+        gr.top_block.__init__(self, "Wideband Capture")
 
-    scanner = wideband_scanner(rec_len=6-speed,
-            sample_rate=sample_rate,
-            ppm=ppm)
+        self.rec_len = rec_len
+        self.sample_rate = sample_rate
+        self.ppm = ppm
 
-    for band in bands:
-        start = time.time()
-        print "\nScanning band: %s"% band
+        self.rtlsdr_source = osmosdr.source( args="numchan=" + str(1) + " " + args )
+        self.rtlsdr_source.set_sample_rate(sample_rate)
+        self.rtlsdr_source.set_freq_corr(ppm, 0)
+        self.rtlsdr_source.set_dc_offset_mode(2, 0)
+        self.rtlsdr_source.set_iq_balance_mode(0, 0)
+        self.rtlsdr_source.set_gain_mode(True, 0)
+        self.rtlsdr_source.set_bandwidth(sample_rate, 0)
+
+        self.head = blocks.head(gr.sizeof_gr_complex * 1, int(rec_len * sample_rate))
+        self.file_sink = blocks.file_sink(gr.sizeof_gr_complex * 1, os.devnull, False)
+        self.file_sink.set_unbuffered(False)
+
+        self.connect((self.rtlsdr_source, 0), (self.head, 0))
+        self.connect((self.head, 0), (self.file_sink, 0))
 
-        first_arfcn = grgsm.arfcn.get_first_arfcn(band)
-        last_arfcn = grgsm.arfcn.get_last_arfcn(band)
-        last_center_arfcn = last_arfcn - int((channels_num / 2) - 1)
+    def capture(self, path, carrier_frequency):
+        # capture half of GSM channel lower than channel center (-0.1MHz), see wideband_scanner
+        self.rtlsdr_source.set_center_freq(carrier_frequency - 0.1e6, 0)
+        self.file_sink.open(path)
+        self.start()
+        self.wait()
+        self.stop()
+        # the file is only closed (and flushed) by do_update, which otherwise waits for the next capture
+        self.file_sink.close()
+        self.file_sink.do_update()
+        self.head.reset()
 
-        current_freq = grgsm.arfcn.arfcn2downlink(first_arfcn + int(channels_num / 2) - 1, band)
-        last_freq = grgsm.arfcn.arfcn2downlink(last_center_arfcn, band)
-        stop_freq = last_freq + 0.2e6 * channels_num
 
-        while current_freq < stop_freq:
-            # instantiate scanner and processor
-            scanner.set_carrier_frequency(current_freq)
+class wideband_file_decoder(gr.top_block):
+    """
+    Decodes the system information of a block recorded by wideband_capture,
+    the decode stage of a pipelined scan
+    """
 
-            # start recording
+    def __init__(self, sample_rate=2e6, carrier_frequency=939e6):
+
+        gr.top_block.__init__(self, "Wideband File Decoder")
+
+        self.sample_rate = sample_rate
+        self.carrier_frequency = carrier_frequency
+
+        self.file_source = blocks.file_source(gr.sizeof_gr_complex * 1, os.devnull, False)
+        # shift again by -0.1MHz in order to align channel center in 0Hz
+        self.blocks_rotator_cc = blocks.rotator_cc(-2 * pi * 0.1e6 / sample_rate)
+        self.wideband_receiver = wideband_receiver(OSR=4, fc=carrier_frequency, samp_rate=sample_rate)
+        self.gsm_extract_system_info = grgsm.extract_system_info()
+
+        self.connect((self.file_source, 0), (self.blocks_rotator_cc, 0))
+        self.connect((self.blocks_rotator_cc, 0), (self.wideband_receiver,0))
+        self.msg_connect(self.wideband_receiver, 'msgs', self.gsm_extract_system_info, 'msgs')
+
+    def decode(self, path, carrier_frequency, channel_mask=None):
+        self.gsm_extract_system_info.reset()
+        self.carrier_frequency = carrier_frequency
+        self.wideband_receiver.set_fc(carrier_frequency)
+        self.wideband_receiver.set_channel_mask(channel_mask)
+        self.file_source.open(path, False)
+        self.start()
+        self.wait()
+        self.stop()
+        self.file_source.close()
+
+class power_probe(gr.top_block):
+    """
+    Records a short block of samples per center frequency to measure the channel powers, used by the pre-scan
+    """
+
+    def __init__(self, rec_len=prescan_time, sample_rate=2e6, ppm=0, args=""):
+
+        gr.top_block.__init__(self, "Power Probe")
+
+        self.sample_rate = sample_rate
+        self.channels_num = int(sample_rate/0.2e6)
+        self.settle_samples = int(settle_time * sample_rate)
+
+        self.rtlsdr_source = osmosdr.source( args="numchan=" + str(1) + " " + args )
+        self.rtlsdr_source.set_sample_rate(sample_rate)
+        self.rtlsdr_source.set_freq_corr(ppm, 0)
+        self.rtlsdr_source.set_dc_offset_mode(2, 0)
+        self.rtlsdr_source.set_iq_balance_mode(0, 0)
+        self.rtlsdr_source.set_gain_mode(True, 0)
+        self.rtlsdr_source.set_bandwidth(sample_rate, 0)
+
+        self.head = blocks.head(gr.sizeof_gr_complex * 1, self.settle_samples + int(rec_len * sample_rate))
+        self.vector_sink = blocks.vector_sink_c()
+
+        self.connect((self.rtlsdr_source, 0), (self.head, 0))
+        self.connect((self.head, 0), (self.vector_sink, 0))
+
+    def measure(self, carrier_frequency):
+        """
+        Returns the power in dB of every channel around carrier_frequency, in the order of the channelizer outputs
+        """
+        # tuned like wideband_scanner, half a channel below the carrier
+        self.rtlsdr_source.set_center_freq(carrier_frequency - 0.1e6, 0)
+        self.vector_sink.reset()
+        self.head.reset()
+        self.start()
+        self.wait()
+        self.stop()
+        samples = numpy.array(self.vector_sink.data(), dtype=numpy.complex64)[self.settle_samples:]
+        return spectrum.channel_powers(samples, self.sample_rate, self.channels_num)
+
+def prescan(bands=[], sample_rate=2e6, ppm=0, threshold=spectrum.threshold_db, args=""):
+    """
+    Measures the channel powers at every center frequency of the bands and returns a dict
+    from each band to a list of (center frequency, channel mask) for the center frequencies with
+    at least one channel more than threshold dB above the noise floor of the band.
+    The channel mask holds these active channels and can be passed to the wideband receiver.
+    """
+    channels_num = int(sample_rate/0.2e6)
+    probe = power_probe(sample_rate=sample_rate, ppm=ppm, args=args)
+    active = {}
+    try:
+        for band in bands:
+            freqs = center_frequencies(band, channels_num)
+            powers = [probe.measure(freq) for freq in freqs]
+            floor = spectrum.noise_floor(powers)
+            active[band] = []
+            for freq, p in zip(freqs, powers):
+                channels = list(spectrum.active_channels(p, floor, threshold))
+                if channels:
+                    active[band].append((freq, channels))
+            print "Pre-scan of %s: %d of %d blocks and %d channels above the noise floor of %.1f dB" % (
+                band, len(active[band]), len(freqs), sum(len(c) for f, c in active[band]), floor)
+    finally:
+        # release the device before the scanner opens it, instead of whenever the probe is collected
+        probe.stop()
+        probe.wait()
+        del probe
+    return active
+
+def scan_plan(band, channels_num, frequencies=None):
+    """
+    Returns the (center frequency, channel mask) pairs to scan in the band,
+    all channels of all center frequencies unless frequencies holds a plan for the band
+    """
+    if frequencies is not None and band in frequencies:
+        return frequencies[band]
+    return [(freq, None) for freq in center_frequencies(band, channels_num)]
+
+class ScannerService(object):
+    """
+    Long-lived scanner that keeps the device and the wideband_scanner flowgraph open between
+    center frequencies, bands and sweeps. Every step retunes the scanner and resets the head,
+    the decoded system information and the burst counts afterwards.
+    """
+
+    def __init__(self, sample_rate=2e6, ppm=0, speed=4, max_dwell=None, args=""):
+        self.sample_rate = sample_rate
+        self.channels_num = int(sample_rate/0.2e6)
+        self.rec_len = 6-speed
+        self.max_dwell = max_dwell or 2 * self.rec_len
+        self.sweeps = 0
+        self.scanner = wideband_scanner(rec_len=self.rec_len,
+                sample_rate=sample_rate,
+                ppm=ppm, args=args)
+
+    def step(self, band, current_freq, channel_mask=None, adaptive_dwell=False):
+        """
+        Records one center frequency and returns the ChannelInfo of the cells found on it
+        """
+        scanner = self.scanner
+        scanner.set_carrier_frequency(current_freq)
+        scanner.set_channel_mask(channel_mask)
+
+        # start recording
+        if adaptive_dwell:
+            scanner.set_rec_len(self.max_dwell)
+            dwell = run_until(scanner, lambda: not scanner.pending_channels(), min(min_dwell, self.max_dwell))
+            print "Recorded %.1f MHz for %.1f seconds" % (current_freq / 1e6, dwell)
+        else:
+            scanner.set_rec_len(self.rec_len)
             scanner.start()
             scanner.wait()
             scanner.stop()
 
-            freq_offsets = numpy.fft.ifftshift(numpy.array(range(int(-numpy.floor(channels_num/2)),int(numpy.floor((channels_num+1)/2))))*2e5)
-            detected_c0_channels = scanner.gsm_extract_system_info.get_chans()
+        found_list = extract_channel_infos(scanner.gsm_extract_system_info, current_freq, self.channels_num, band)
+
+        # Remove old retrieved data
+        scanner.head.reset()
+        scanner.gsm_extract_system_info.reset()
+        scanner.burst_counter.reset()
+        return found_list
+
+    def sweep(self, bands, frequencies=None, adaptive_dwell=False):
+        """
+        Scans the bands and returns the ChannelInfo of every cell found.
+        frequencies = dict from band to the (center frequency, channel mask) pairs to scan, see prescan
+        """
+        found_list = []
+        for band in bands:
+            print "\nScanning band: %s"% band
+            for current_freq, channel_mask in scan_plan(band, self.channels_num, frequencies):
+                found_list += self.step(band, current_freq, channel_mask, adaptive_dwell)
+        self.sweeps += 1
+        return found_list
+
+    def close(self):
+        """
+        Stops the flowgraph and releases it, and with it the device
+        """
+        if self.scanner is not None:
+            self.scanner.stop()
+            self.scanner.wait()
+        self.scanner = None
+
+def scan(bands=[], sample_rate=2e6, ppm=0, gain=30.0, speed=4, pipeline=False, prescan_bands=False, adaptive_dwell=False, max_dwell=None, service=None, args=""):
+    """
+    Scans the bands and returns the ChannelInfo of every cell found.
+    adaptive_dwell = finish a center frequency once every synchronized channel produced its cell identity,
+    but not before min_dwell seconds, and extend it up to max_dwell seconds (default twice 6-speed)
+    while channels synchronized without producing it. Does not apply to the pipelined scan.
+    service = ScannerService to reuse, by default one is opened for this scan only. The pre-scan and the
+    pipelined scan open the device themselves and cannot be combined with an open service.
+    args = osmosdr arguments of the device to scan with, e.g. rtl=0
+    """
 
-            if detected_c0_channels:
-                chans = numpy.array(scanner.gsm_extract_system_info.get_chans())
-                found_freqs = current_freq + freq_offsets[(chans)]
+    frequencies = None
+    if prescan_bands:
+        # only decode the blocks with a carrier, prescan releases the device before it returns
+        frequencies = prescan(bands, sample_rate, ppm, args=args)
 
-                cell_ids = numpy.array(scanner.gsm_extract_system_info.get_cell_id())
-                lacs = numpy.array(scanner.gsm_extract_system_info.get_lac())
-                mccs = numpy.array(scanner.gsm_extract_system_info.get_mcc())
-                mncs = numpy.array(scanner.gsm_extract_system_info.get_mnc())
-                ccch_confs = numpy.array(scanner.gsm_extract_system_info.get_ccch_conf())
-                powers = numpy.array(scanner.gsm_extract_system_info.get_pwrs())
+    if pipeline:
+        return pipelined_scan(bands, sample_rate, ppm, gain, speed, frequencies=frequencies, args=args)
 
+    if service is None:
+        service = ScannerService(sample_rate, ppm, speed, max_dwell, args=args)
+    return service.sweep(bands, frequencies, adaptive_dwell)
 
-                for i in range(0, len(chans)):
-                    cell_arfcn_list = scanner.gsm_extract_system_info.get_cell_arfcns(chans[i])
-                    neighbour_list = scanner.gsm_extract_system_info.get_neighbours(chans[i])
+def start_decoders(blocks_queue, sample_rate, found_list, workers=decode_workers, remove=False):
+    """
+    Starts workers threads that decode the (band, center frequency, channel mask, path) blocks
+    put in blocks_queue with a wideband_file_decoder each and add the ChannelInfo of the cells
+    found to found_list. remove = delete the files once they are decoded.
+    Returns the threads, stop them with stop_decoders
+    """
+    lock = threading.Lock()
+    channels_num = int(sample_rate/0.2e6)
 
-                    info = ChannelInfo(grgsm.arfcn.downlink2arfcn(found_freqs[i], band), found_freqs[i], cell_ids[i], lacs[i], mccs[i], mncs[i], ccch_confs[i], powers[i], neighbour_list, cell_arfcn_list)
+    def decode():
+        decoder = wideband_file_decoder(sample_rate=sample_rate)
+        while True:
+            block = blocks_queue.get()
+            if block is None:
+                break
+            band, current_freq, channel_mask, path = block
+            try:
+                decoder.decode(path, current_freq, channel_mask)
+                infos = extract_channel_infos(decoder.gsm_extract_system_info, current_freq, channels_num, band)
+                with lock:
+                    found_list.extend(infos)
+            except Exception as e:
+                print "Decoding the block at %.1f MHz failed: %s" % (current_freq / 1e6, e)
+            finally:
+                if remove:
+                    os.remove(path)
+
+    threads = [threading.Thread(target=decode) for i in xrange(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    return threads
+
+def stop_decoders(blocks_queue, threads):
+    """
+    Waits until the decoders started by start_decoders decoded all queued blocks
+    """
+    for thread in threads:
+        blocks_queue.put(None)
+    for thread in threads:
+        thread.join()
+
+def pipelined_scan(bands=[], sample_rate=2e6, ppm=0, gain=30.0, speed=4, queue_size=pipeline_queue_size, workers=decode_workers, frequencies=None, args=""):
+    """
+    Scans like scan, but decodes the blocks captured at the previous center frequencies while the
+    SDR captures the next one. The captured blocks are kept in memory (/dev/shm if available),
+    at most queue_size of them wait for one of the decode workers.
+    frequencies = dict from band to the (center frequency, channel mask) pairs to scan, see prescan
+    """
+    found_list = []
+    channels_num = int(sample_rate/0.2e6)
+    blocks_queue = Queue.Queue(queue_size)
+    tmp_dir = tempfile.mkdtemp(prefix='icc-scan-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    threads = start_decoders(blocks_queue, sample_rate, found_list, workers, remove=True)
+
+    capture = None
+    try:
+        capture = wideband_capture(rec_len=6-speed, sample_rate=sample_rate, ppm=ppm, args=args)
+        for band in bands:
+            print "\nScanning band: %s"% band
+            for i, (current_freq, channel_mask) in enumerate(scan_plan(band, channels_num, frequencies)):
+                path = os.path.join(tmp_dir, "%s-%d.cfile" % (band, i))
+                capture.capture(path, current_freq)
+                # blocks while queue_size captured blocks are waiting to be decoded
+                blocks_queue.put((band, current_freq, channel_mask, path))
+    finally:
+        # release the device right away, the decoders may need a while for the last blocks
+        if capture is not None:
+            capture.stop()
+            capture.wait()
+        capture = None
+        stop_decoders(blocks_queue, threads)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
-                    if info.arfcn:
-                        found_list.append(info)
-                        print info.arfcn
-                    else:
-                        print 'Skipping `None`...'
+    return found_list
 
-            # Remove old retrieved data
-            scanner.head.reset()
-            scanner.gsm_extract_system_info.reset()
-            current_freq += channels_num * 0.2e6
+def record(directory, bands=[], sample_rate=2e6, ppm=0, speed=4, frequencies=None, args=""):
+    """
+    Records every center frequency of the bands to a file in directory and writes the
+    manifest_file describing the blocks, to be scanned later with file_scan.
+    Returns the path of the manifest
+    """
+    channels_num = int(sample_rate/0.2e6)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    manifest = {'sample_rate': sample_rate, 'ppm': ppm, 'rec_len': 6-speed, 'blocks': []}
+    capture = wideband_capture(rec_len=6-speed, sample_rate=sample_rate, ppm=ppm, args=args)
+    try:
+        for band in bands:
+            print "\nRecording band: %s"% band
+            for i, (current_freq, channel_mask) in enumerate(scan_plan(band, channels_num, frequencies)):
+                file_name = "%s-%d.cfile" % (band, i)
+                capture.capture(os.path.join(directory, file_name), current_freq)
+                manifest['blocks'].append({'band': band, 'center_frequency': current_freq,
+                                           'channel_mask': channel_mask, 'file': file_name})
+    finally:
+        # release the device instead of waiting for the garbage collector
+        capture.stop()
+        capture.wait()
+        del capture
+
+    path = os.path.join(directory, manifest_file)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+def file_scan(manifest_path, workers=decode_workers):
+    """
+    Scans the blocks recorded by record as fast as the CPU allows, decoding workers blocks in parallel.
+    manifest_path = the manifest or the directory holding it
+    Returns the ChannelInfo of every cell found, like scan
+    """
+    if os.path.isdir(manifest_path):
+        manifest_path = os.path.join(manifest_path, manifest_file)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(os.path.abspath(manifest_path))
 
+    found_list = []
+    blocks_queue = Queue.Queue()
+    for block in manifest['blocks']:
+        blocks_queue.put((block['band'], block['center_frequency'], block.get('channel_mask'),
+                          os.path.join(directory, block['file'])))
+    threads = start_decoders(blocks_queue, manifest['sample_rate'], found_list, workers)
+    stop_decoders(blocks_queue, threads)
     return found_list
 
 if __name__ == '__main__':
@@ -383,72 +826,27 @@ if __name__ == '__main__':
     if not options.no_neighbours:
         print "\tNeighbour Consistency Check"
 
-    arfcn_list = dict()
-    for band in to_scan:
-        options.band = band
-        print "\nScanning band: %s"% band
-
-
-        first_arfcn = grgsm.arfcn.get_first_arfcn(options.band)
-        last_arfcn = grgsm.arfcn.get_last_arfcn(options.band)
-        last_center_arfcn = last_arfcn - int((channels_num / 2) - 1)
-
-        current_freq = grgsm.arfcn.arfcn2downlink(first_arfcn + int(channels_num / 2) - 1, options.band)
-        last_freq = grgsm.arfcn.arfcn2downlink(last_center_arfcn, options.band)
-        stop_freq = last_freq + 0.2e6 * channels_num
-
-        while current_freq < stop_freq:
-
-            # silence rtl_sdr output:
-            # open 2 fds
-            null_fds = [os.open(os.devnull, os.O_RDWR) for x in xrange(2)]
-            # save the current file descriptors to a tuple
-            save = os.dup(1), os.dup(2)
-            # put /dev/null fds on 1 and 2
-            os.dup2(null_fds[0], 1)
-            os.dup2(null_fds[1], 2)
-
-            # instantiate scanner and processor
-            scanner = wideband_scanner(rec_len=6-options.speed,
-                                sample_rate=options.samp_rate,
-                                carrier_frequency=current_freq,
-                                ppm=options.ppm, args=options.args)
-
-            # start recording
-            scanner.start()
-            scanner.wait()
-            scanner.stop()
-
-            # restore file descriptors so we can print the results
-            os.dup2(save[0], 1)
-            os.dup2(save[1], 2)
-            # close the temporary fds
-            os.close(null_fds[0])
-            os.close(null_fds[1])
-
-            freq_offsets = numpy.fft.ifftshift(numpy.array(range(int(-numpy.floor(channels_num/2)),int(numpy.floor((channels_num+1)/2))))*2e5)
-            detected_c0_channels = scanner.gsm_extract_system_info.get_chans()
-
-            if detected_c0_channels:
-                chans = numpy.array(scanner.gsm_extract_system_info.get_chans())
-                found_freqs = current_freq + freq_offsets[(chans)]
-
-                cell_ids = numpy.array(scanner.gsm_extract_system_info.get_cell_id())
-                lacs = numpy.array(scanner.gsm_extract_system_info.get_lac())
-                mccs = numpy.array(scanner.gsm_extract_system_info.get_mcc())
-                mncs = numpy.array(scanner.gsm_extract_system_info.get_mnc())
-                ccch_confs = numpy.array(scanner.gsm_extract_system_info.get_ccch_conf())
-                powers = numpy.array(scanner.gsm_extract_system_info.get_pwrs())
-
-                found_list = dict()
-                for i in range(0, len(chans)):
-                    cell_arfcn_list = scanner.gsm_extract_system_info.get_cell_arfcns(chans[i])
-                    neighbour_list = scanner.gsm_extract_system_info.get_neighbours(chans[i])
-
-                    info = ChannelInfo(grgsm.arfcn.downlink2arfcn(found_freqs[i], options.band), found_freqs[i], cell_ids[i], lacs[i], mccs[i], mncs[i], ccch_confs[i], powers[i], neighbour_list, cell_arfcn_list)
-
-                    found_list[info.arfcn] = info
-                    print info.arfcn
-
-            scanner = None
-            current_freq += channels_num * 0.2e6
+    # silence rtl_sdr output:
+    # open 2 fds
+    null_fds = [os.open(os.devnull, os.O_RDWR) for x in xrange(2)]
+    # save the current file descriptors to a tuple
+    save = os.dup(1), os.dup(2)
+    # put /dev/null fds on 1 and 2
+    os.dup2(null_fds[0], 1)
+    os.dup2(null_fds[1], 2)
+
+    # instantiate scanner and processor once, it is retuned for every center frequency
+    service = ScannerService(sample_rate=options.samp_rate, ppm=options.ppm, speed=options.speed, args=options.args)
+
+    # restore file descriptors so we can print the results
+    os.dup2(save[0], 1)
+    os.dup2(save[1], 2)
+    # close the temporary fds
+    os.close(null_fds[0])
+    os.close(null_fds[1])
+
+    found_list = dict()
+    for info in service.sweep(to_scan):
+        found_list[info.arfcn] = info
+        if options.verbose:
+            print info.get_verbose_info()
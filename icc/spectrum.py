@@ -0,0 +1,66 @@
+"""
+Power measurements of captured IQ blocks, used to skip the parts of a band without carriers
+before running the GSM receivers on them.
+"""
+
+import numpy
+
+fft_size = 1024
+channel_bandwidth = 0.2e6
+channel_passband = 0.18e6 # part of a channel that is used to measure its power
+noise_floor_percentile = 25 # % of the channels of a band that are assumed to carry no signal
+threshold_db = 10 # dB above the noise floor for a channel to be considered active
+
+
+def power_spectrum(samples, sample_rate, fft_size=fft_size):
+    """
+    Returns the frequencies relative to the center and the power spectrum of the samples,
+    averaged over non-overlapping Hann windowed frames of fft_size samples (Welch's method)
+    """
+    samples = numpy.asarray(samples, dtype=numpy.complex64)
+    frames = len(samples) // fft_size
+    if frames == 0:
+        raise ValueError("at least %d samples are needed, got %d" % (fft_size, len(samples)))
+    window = numpy.hanning(fft_size)
+    spectra = numpy.fft.fft(samples[:frames * fft_size].reshape(frames, fft_size) * window, axis=1)
+    power = numpy.mean(numpy.abs(spectra) ** 2, axis=0) / numpy.sum(window ** 2)
+    freqs = numpy.fft.fftfreq(fft_size, 1.0 / sample_rate)
+    return numpy.fft.fftshift(freqs), numpy.fft.fftshift(power)
+
+
+def channel_offsets(channels_num):
+    """
+    Returns the offsets of the channels from the carrier frequency, in the order of the
+    outputs of the channelizer in wideband_receiver
+    """
+    return numpy.fft.ifftshift(numpy.arange(-(channels_num // 2), (channels_num + 1) // 2)) * channel_bandwidth
+
+
+def channel_powers(samples, sample_rate, channels_num, center_offset=-0.1e6, fft_size=fft_size):
+    """
+    Returns the power in dB of every channel in the block, in the order of channel_offsets.
+    center_offset = frequency the samples are centered at, relative to the carrier frequency
+    (the scanner tunes half a channel below the carrier)
+    """
+    freqs, power = power_spectrum(samples, sample_rate, fft_size)
+    freqs = freqs + center_offset
+    powers = numpy.zeros(channels_num)
+    for chan, offset in enumerate(channel_offsets(channels_num)):
+        inside = numpy.abs(freqs - offset) <= channel_passband / 2
+        if inside.any():
+            powers[chan] = numpy.mean(power[inside])
+    return 10 * numpy.log10(numpy.maximum(powers, 1e-20))
+
+
+def noise_floor(powers, percentile=noise_floor_percentile):
+    """
+    Returns the noise floor in dB of the channel powers of one or more blocks
+    """
+    return numpy.percentile(numpy.concatenate([numpy.ravel(p) for p in powers]), percentile)
+
+
+def active_channels(powers, floor, threshold=threshold_db):
+    """
+    Returns the channels of a block with a power more than threshold dB above the noise floor
+    """
+    return numpy.flatnonzero(numpy.asarray(powers) > floor + threshold)
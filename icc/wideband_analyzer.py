@@ -0,0 +1,182 @@
+from gnuradio import blocks
+from gnuradio import gr
+from gnuradio.filter import firdes
+from gnuradio.filter import freq_xlating_fir_filter_ccc
+from collections import namedtuple
+
+import grgsm
+import osmosdr
+
+from pdu_sink import pdu_queue_sink
+
+
+"""
+Block that analyses several cell towers at once from one wideband capture.
+Every target ARFCN in the captured window gets its own channel filter, GSM receiver and
+demapper/decoder chain, and the decoded frames of an ARFCN only go to the pdu queues of that target.
+"""
+
+usable_bandwidth = 0.8 # part of the sample rate that is free of the roll-off of the SDR filters
+channel_rate = 0.4e6 # sample rate of the channel handed to each GSM receiver
+channel_cutoff = 125e3 # cutoff frequency of the channel filter
+channel_transition = 50e3 # transition width of the channel filter
+dc_guard = 0.1e6 # minimal distance of a target from the center frequency, keeps the DC spike out of the channels
+
+AnalysisTarget = namedtuple('AnalysisTarget', ['arfcn', 'pdu_queues', 'capture_id'])
+
+
+def arfcnDownlink(arfcn):
+    for band in grgsm.arfcn.get_bands():
+        if grgsm.arfcn.is_valid_arfcn(arfcn, band):
+            return grgsm.arfcn.arfcn2downlink(arfcn, band)
+    return None
+
+
+def channel_filter(samp_rate, offset):
+    """
+    Returns a filter that moves the channel at offset from the center to 0 Hz and decimates it,
+    and the sample rate of its output
+    """
+    decimation = max(1, int(samp_rate // channel_rate))
+    taps = firdes.low_pass(1.0, samp_rate, channel_cutoff, channel_transition)
+    return freq_xlating_fir_filter_ccc(decimation, taps, offset, samp_rate), samp_rate / decimation
+
+
+def analysis_windows(arfcns, samp_rate):
+    """
+    Groups the arfcns into windows that one capture at samp_rate covers.
+    Returns a list of (center frequency, arfcns in the window), arfcns without a downlink frequency are left out
+    """
+    span = samp_rate * usable_bandwidth - 0.2e6 - 2 * dc_guard # room for the channel widths and a shifted center
+    tuned = []
+    for arfcn in set(arfcns):
+        fc = arfcnDownlink(arfcn)
+        if fc is None:
+            print "ARFCN %s is not in any known band, it can not be analyzed" % arfcn
+        else:
+            tuned.append((fc, arfcn))
+
+    windows = []
+    for fc, arfcn in sorted(tuned):
+        if windows and fc - windows[-1][0] <= span:
+            windows[-1][1].append((fc, arfcn))
+        else:
+            windows.append((fc, [(fc, arfcn)]))
+
+    result = []
+    for low, members in windows:
+        freqs = [fc for fc, arfcn in members]
+        center = (min(freqs) + max(freqs)) / 2
+        if any(abs(fc - center) < dc_guard for fc in freqs):
+            center -= dc_guard
+        result.append((center, [arfcn for fc, arfcn in members]))
+    return result
+
+
+class WidebandAnalyzer(gr.top_block):
+
+    def __init__(self, gain=None, samp_rate=None, ppm=None, center_freq=None, targets=[], capture_id=None, udp_ports=[], max_timeslot=0, store_capture=True, rec_length=None, args=""):
+        """
+        center_freq = frequency the SDR is tuned to, see analysis_windows
+        targets = a list of AnalysisTarget, the ARFCNs to analyze with the pdu queues (e.g. DetectorManager.queue)
+                  their frames are handed to and the identifier of their burst file
+        capture_id = identifier for the wideband capture file (<capture_id>.cfile)
+        store_capture = boolean indicating if the capture and the bursts should be stored on disk or not
+        rec_length = capture time in seconds
+        max_timeslot = timeslot 0...max_timeslot will be decoded
+        udp_ports = a list of udp ports to send the frames of all targets to, e.g. for external tools like Wireshark
+        """
+
+        gr.top_block.__init__(self, "Gr-gsm Wideband Capture")
+
+        self.gain = gain
+        self.samp_rate = samp_rate
+        self.ppm = ppm
+        self.center_freq = center_freq
+        self.targets = targets
+        self.capture_id = capture_id
+        self.store_capture = store_capture
+        self.rec_length = rec_length
+
+        self.rtlsdr_source = osmosdr.source( args="numchan=" + str(1) + " " + args )
+        self.rtlsdr_source.set_sample_rate(samp_rate)
+        self.rtlsdr_source.set_center_freq(center_freq, 0)
+        self.rtlsdr_source.set_freq_corr(ppm, 0)
+        self.rtlsdr_source.set_dc_offset_mode(2, 0)
+        self.rtlsdr_source.set_iq_balance_mode(2, 0)
+        self.rtlsdr_source.set_gain_mode(True, 0)
+        self.rtlsdr_source.set_gain(gain, 0)
+        self.rtlsdr_source.set_if_gain(20, 0)
+        self.rtlsdr_source.set_bb_gain(20, 0)
+        self.rtlsdr_source.set_antenna("", 0)
+        self.rtlsdr_source.set_bandwidth(samp_rate, 0)
+
+        #Run for the specified amount of seconds or indefinitely
+        source = self.rtlsdr_source
+        if self.rec_length is not None:
+            self.blocks_head_0 = blocks.head(gr.sizeof_gr_complex, int(samp_rate*rec_length))
+            self.connect((self.rtlsdr_source, 0), (self.blocks_head_0, 0))
+            source = self.blocks_head_0
+
+        if self.store_capture:
+            self.blocks_file_sink = blocks.file_sink(gr.sizeof_gr_complex*1, str(self.capture_id) + ".cfile", False)
+            self.blocks_file_sink.set_unbuffered(False)
+            self.connect((source, 0), (self.blocks_file_sink, 0))
+
+        #UDP clients shared by all targets
+        self.client_sockets = [blocks.socket_pdu("UDP_CLIENT", "127.0.0.1", str(udp_port), 10000) for udp_port in udp_ports]
+
+        self.channels = []
+        for target in targets:
+            self.channels.append(self.create_channel(source, target, max_timeslot))
+
+    def create_channel(self, source, target, max_timeslot):
+        """
+        Connects the chain of one target: channel filter, GSM receiver, demappers and decoders
+        """
+        fc = arfcnDownlink(target.arfcn)
+        channel = {}
+        channel['filter'], channel_samp_rate = channel_filter(self.samp_rate, fc - self.center_freq)
+        channel['input'] = grgsm.gsm_input(ppm=0, osr=4, fc=fc, samp_rate_in=channel_samp_rate)
+        channel['receiver'] = grgsm.receiver(4, ([target.arfcn]), ([]))
+        channel['clock_offset_control'] = grgsm.clock_offset_control(fc)
+
+        #Control channel demapper for timeslot 0, the other timeslots are assumed to contain sdcch8 logical channels
+        demappers = [grgsm.gsm_bcch_ccch_demapper(0)]
+        for i in range(1, max_timeslot + 1):
+            demappers.append(grgsm.gsm_sdcch8_demapper(i))
+        decoders = [grgsm.control_channels_decoder() for i in range(0, max_timeslot + 1)]
+        sinks = [pdu_queue_sink(pdu_queue) for pdu_queue in target.pdu_queues]
+        channel['demappers'] = demappers
+        channel['decoders'] = decoders
+        channel['pdu_sinks'] = sinks
+
+        self.connect((source, 0), (channel['filter'], 0))
+        self.connect((channel['filter'], 0), (channel['input'], 0))
+        self.connect((channel['input'], 0), (channel['receiver'], 0))
+        self.msg_connect(channel['clock_offset_control'], "ppm", channel['input'], "ppm_in")
+        self.msg_connect(channel['receiver'], "measurements", channel['clock_offset_control'], "measurements")
+
+        if self.store_capture:
+            channel['burst_file_sink'] = grgsm.burst_file_sink(str(target.capture_id) + ".burstfile")
+            self.msg_connect(channel['receiver'], "C0", channel['burst_file_sink'], "in")
+
+        for demapper, decoder in zip(demappers, decoders):
+            self.msg_connect((channel['receiver'], 'C0'), (demapper, 'bursts'))
+            self.msg_connect((demapper, 'bursts'), (decoder, 'bursts'))
+            #Only this target's sinks get the frames of this arfcn
+            for sink in sinks:
+                self.msg_connect((decoder, 'msgs'), (sink, 'msgs'))
+            for client_socket in self.client_sockets:
+                self.msg_connect((decoder, 'msgs'), (client_socket, 'pdus'))
+        return channel
+
+    def get_center_freq(self):
+        return self.center_freq
+
+    def get_rec_length(self):
+        return self.rec_length
+
+    def set_rec_length(self, rec_length):
+        self.rec_length = rec_length
+        self.blocks_head_0.set_length(int(self.samp_rate*self.rec_length))
@@ -3,8 +3,15 @@ from icc.runner import listScans as lc
 from icc.aux.lat_log_utils import parse_dms
 import grgsm
 import click
+import time
 from icc.file_analyzer import FileAnalyzer
 from icc.runner import offlineDetection
+from icc.cellinfochecks.import_towers import importTowers as it, createLocationIndex
+from icc.cellinfochecks.query_cell_tower import tower_database
+from icc.cellinfochecks.tower_index import buildTowerIndex as bti, indexPath
+from icc.scanner import record as rec, file_scan, decode_workers
+from icc.scan_coordinator import file_device_prefix
+from icc import monitor as mon
 
 @click.group()
 @click.option('--ppm', '-p', default=0, help='frequency offset in parts per million, default 0')
@@ -29,27 +36,14 @@ def cli(ctx, samplerate, ppm, gain, speed):
     ctx.obj['gain'] = gain
     ctx.obj['speed'] = speed
 
-@click.command()
-@click.option('--band', '-b', default="900M-Bands", help="select the band to scan. One of: E-GSM, P-GSM or R-GSM")
-@click.option('--rec_time_sec', '-r', default=10, help='if the analyze option is specified, sets the recording time for each tower analysis in seocnds')
-@click.option('--analyze' , '-a', is_flag=True, help='turns on anylis of each tower found of the scan. Will produce a capture file of each tower for duration specified with --rec_time_sec')
-@click.option('--detection' , '-d', is_flag=True, help='if the analyze option is specified, turns on IMSI catcher detection during analysis of each tower')
-@click.option('--location' , '-l', type=str, default='', help='current location used to mark a scan in Apple GPS minutes format')
-@click.option('--lat', type=float, help='latitude used to specify the scan location, is used by detectors that perform location based detection of IMSI catchers')
-@click.option('--lon', type=float, help='longitude used to specify the scan location, is used by detectors that perform location based detection of IMSI catchers')
-@click.option('--unmute', '-u', is_flag=True, help='if the analyze option is specified, unmutes the output during analysis which will show the output of your capture device when it starts')
-@click.option('--no_store', '-S', is_flag=True, help='Do not store scan data')
-@click.pass_context
-def scan(ctx, band, rec_time_sec, analyze, detection, location, lat, lon, unmute, no_store):
+def bandsToScan(band):
     """
-    Scans for nearby cell towers and analyzes each cell tower and perfroms IMSI catcher detection if both are enabled.
-    Note: if no location is specified, analysis of found towers is off
-    :param detection: determines if druing analysis the packet based detectors are run
+    Returns the bands selected by the band option, or None if it is invalid
     """
     if band != "900M-Bands":
         if band not in grgsm.arfcn.get_bands():
             print "Invalid GSM band\n"
-            return
+            return None
 
     if band == "900M-Bands":
         to_scan = ['P-GSM',
@@ -63,10 +57,45 @@ def scan(ctx, band, rec_time_sec, analyze, detection, location, lat, lon, unmute
                     ]
     else:
         to_scan = [band]
+    return to_scan
 
+@click.command()
+@click.option('--band', '-b', default="900M-Bands", help="select the band to scan. One of: E-GSM, P-GSM or R-GSM")
+@click.option('--rec_time_sec', '-r', default=10, help='if the analyze option is specified, sets the recording time for each tower analysis in seocnds')
+@click.option('--analyze' , '-a', is_flag=True, help='turns on anylis of each tower found of the scan. Will produce a capture file of each tower for duration specified with --rec_time_sec')
+@click.option('--detection' , '-d', is_flag=True, help='if the analyze option is specified, turns on IMSI catcher detection during analysis of each tower')
+@click.option('--location' , '-l', type=str, default='', help='current location used to mark a scan in Apple GPS minutes format')
+@click.option('--lat', type=float, help='latitude used to specify the scan location, is used by detectors that perform location based detection of IMSI catchers')
+@click.option('--lon', type=float, help='longitude used to specify the scan location, is used by detectors that perform location based detection of IMSI catchers')
+@click.option('--unmute', '-u', is_flag=True, help='if the analyze option is specified, unmutes the output during analysis which will show the output of your capture device when it starts')
+@click.option('--no_store', '-S', is_flag=True, help='Do not store scan data')
+@click.option('--gsmtap_port', type=int, help='if the analyze option is specified, also sends the decoded GSMTap frames to this UDP port on localhost, e.g. 4729 for Wireshark')
+@click.option('--min_dwell', type=int, default=2, help='if the detection option is specified, the analysis of a tower stops as soon as all detectors reached their verdict, but not before this number of seconds')
+@click.option('--pipeline', is_flag=True, help='decode the samples of the previous frequency while the next one is recorded, speeds up the scan at the cost of memory')
+@click.option('--prescan', is_flag=True, help='measure the power at every frequency first and only decode the channels with a carrier')
+@click.option('--adaptive_dwell', is_flag=True, help='stop recording a frequency as soon as all cells on it are identified, and record longer while cells are synchronized but not yet identified')
+@click.option('--daemon', is_flag=True, help='keep scanning, the scanner stays open between the sweeps unless the analyze option is specified')
+@click.option('--interval', type=int, default=0, help='if the daemon option is specified, seconds between the start of two sweeps')
+@click.option('--sweeps', type=int, default=0, help='if the daemon option is specified, stop after this number of sweeps, default 0 = never')
+@click.option('--wideband_analysis', is_flag=True, help='if the analyze option is specified, records the towers that fit in the sample rate together and analyzes them in parallel, instead of one tower after the other')
+@click.option('--device', multiple=True, help='osmosdr arguments of a device to scan with, e.g. rtl=0. Given multiple times the bands are split over the devices, which scan in parallel. file:DIRECTORY stands in for a device with the samples recorded in DIRECTORY')
+@click.pass_context
+def scan(ctx, band, rec_time_sec, analyze, detection, location, lat, lon, unmute, no_store, gsmtap_port, min_dwell, pipeline, prescan, adaptive_dwell, daemon, interval, sweeps, wideband_analysis, device):
+    """
+    Scans for nearby cell towers and analyzes each cell tower and perfroms IMSI catcher detection if both are enabled.
+    Note: if no location is specified, analysis of found towers is off
+    :param detection: determines if druing analysis the packet based detectors are run
+    """
+    to_scan = bandsToScan(band)
+    if to_scan is None:
+        return
 
     args=ctx.obj
 
+    if (pipeline or prescan) and (len(device) > 1 or any(d.startswith(file_device_prefix) for d in device)):
+        print "The pipeline and prescan options can not be combined with several devices or a file: device"
+        raise click.Abort
+
     try:
         loc = parse_dms(location)
         lat = loc[0]
@@ -87,8 +116,41 @@ def scan(ctx, band, rec_time_sec, analyze, detection, location, lat, lon, unmute
 
     #Add scan to database
     #
-    runner = Runner(bands=to_scan, sample_rate=args['samplerate'], ppm=args['ppm'], gain=args['gain'], speed=args['speed'], rec_time_sec=rec_time_sec, current_location=location, store_capture=not no_store)
-    runner.start(lat, lon, analyze=analyze, detection=detection, mute=not unmute)
+    runner = Runner(bands=to_scan, sample_rate=args['samplerate'], ppm=args['ppm'], gain=args['gain'], speed=args['speed'], rec_time_sec=rec_time_sec, current_location=location, store_capture=not no_store, gsmtap_port=gsmtap_port, min_dwell_sec=min_dwell, pipeline=pipeline, prescan=prescan, adaptive_dwell=adaptive_dwell, devices=device, wideband_analysis=wideband_analysis)
+    if daemon:
+        runner.daemon(lat, lon, interval=interval, sweeps=sweeps, analyze=analyze, detection=detection, mute=not unmute)
+    else:
+        runner.start(lat, lon, analyze=analyze, detection=detection, mute=not unmute)
+
+@click.command(help='Keeps watching the cells with cheap passes over the known cells and a slice of the bands, and a full sweep every few passes. Prints the new, disappeared and changed cells')
+@click.option('--band', '-b', default="900M-Bands", help="select the band to monitor. One of: E-GSM, P-GSM or R-GSM")
+@click.option('--location' , '-l', type=str, default='', help='current location in Apple GPS minutes format, the cells of the last stored scan near it are the starting point')
+@click.option('--lat', type=float, help='latitude of the current location')
+@click.option('--lon', type=float, help='longitude of the current location')
+@click.option('--interval', type=int, default=0, help='seconds between the start of two passes')
+@click.option('--passes', type=int, default=0, help='stop after this number of passes, default 0 = never')
+@click.option('--full_every', type=int, default=mon.full_sweep_every, help='every this number of passes the bands are swept completely')
+@click.option('--rotation', type=int, default=mon.rotation_size, help='number of other center frequencies scanned in each pass besides the known cells')
+@click.option('--power_threshold', type=int, default=mon.power_threshold, help='power change in dB of a cell to report')
+@click.option('--adaptive_dwell', is_flag=True, help='stop recording a frequency as soon as all cells on it are identified')
+@click.option('--device', help='osmosdr arguments of the device to scan with, e.g. rtl=0')
+@click.pass_context
+def monitor(ctx, band, location, lat, lon, interval, passes, full_every, rotation, power_threshold, adaptive_dwell, device):
+    to_scan = bandsToScan(band)
+    if to_scan is None:
+        return
+    if full_every < 1:
+        print "Invalid full sweep interval, must be at least 1 pass"
+        raise click.Abort
+
+    args = ctx.obj
+    try:
+        lat, lon = parse_dms(location)
+    except:
+        pass
+
+    runner = Runner(bands=to_scan, sample_rate=args['samplerate'], ppm=args['ppm'], gain=args['gain'], speed=args['speed'], rec_time_sec=0, current_location=location, store_capture=False, adaptive_dwell=adaptive_dwell, devices=(device,) if device else ())
+    runner.monitor(lat, lon, interval=interval, passes=passes, full_sweep_every=full_every, rotation_size=rotation, power_threshold=power_threshold)
 
 @click.command(help='Prints the saved scans')
 @click.option('--limit', '-n', help='Limit the number of results returned', default=10)
@@ -120,10 +182,53 @@ def analyzeFile(filename, sample_rate, arfcn, timeslot, chan_mode):
 def createdb():
     createDatabase()
 
+@click.command(help='Builds the tower database from an opencellid csv export (.csv or .csv.gz)')
+@click.argument('csv_file', type=str)
+@click.option('--database', default=tower_database, help='tower database to (re)build')
+@click.option('--mcc', type=int, multiple=True, help='only import the towers of this mobile country code, e.g. 204 for the Netherlands. Can be given multiple times')
+@click.option('--radio', multiple=True, help='only import the towers of this radio type, e.g. GSM. Can be given multiple times')
+@click.option('--chunk_size', default=100000, help='number of rows inserted per transaction')
+@click.option('--index/--no-index', default=True, help='also build the memory-mapped tower index, default on')
+def importTowers(csv_file, database, mcc, radio, chunk_size, index):
+    it(csv_file, database=database, mccs=mcc, radios=radio, chunk_size=chunk_size, build_index=index)
+
+@click.command(help='Builds the memory-mapped tower index next to the tower database, and adds the location index to the database if it is missing')
+@click.option('--database', default=tower_database, help='tower database to index')
+def buildTowerIndex(database):
+    createLocationIndex(database)
+    print "Indexed %d towers in %s" % (bti(database), indexPath(database))
+
+@click.command(help='Records the samples of every frequency of the bands to a directory, to be scanned later with scanfile')
+@click.argument('directory', type=str)
+@click.option('--band', '-b', default="900M-Bands", help="select the band to record. One of: E-GSM, P-GSM or R-GSM")
+@click.pass_context
+def record(ctx, directory, band):
+    to_scan = bandsToScan(band)
+    if to_scan is None:
+        return
+    args = ctx.obj
+    manifest = rec(directory, to_scan, sample_rate=args['samplerate'], ppm=args['ppm'], speed=args['speed'])
+    print "Recorded %s" % manifest
+
+@click.command(help='Scans the samples recorded with record, as fast as the CPU allows')
+@click.argument('directory', type=str)
+@click.option('--workers', '-w', default=decode_workers, help='number of frequencies decoded in parallel')
+def scanFile(directory, workers):
+    start = time.time()
+    found = file_scan(directory, workers=workers)
+    print "Found %d cell towers in %.1f seconds" % (len(found), time.time() - start)
+    for info in sorted(found):
+        print "ARFCN: %4u, Freq: %6.1fM, CID: %5u, LAC: %5u, MCC: %3u, MNC: %3u, Pwr: %3i" % (info.arfcn, info.freq/1e6, info.cid, info.lac, info.mcc, info.mnc, info.power)
+
 if __name__ == "__main__":
     cli.add_command(scan)
     cli.add_command(listScans)
     cli.add_command(createdb)
+    cli.add_command(importTowers)
+    cli.add_command(buildTowerIndex)
     cli.add_command(analyzeFile)
+    cli.add_command(record)
+    cli.add_command(scanFile)
+    cli.add_command(monitor)
     cli.add_command(detectOffline)
     cli(obj={})
@@ -0,0 +1,66 @@
+import threading
+import unittest
+
+from icc.aux.flowgraph import run_until
+from icc.detector_manager import DetectorManager
+from icc.detectors.a5_detector import A5Detector
+from icc.detectors.id_request_detector import IDRequestDetector
+from icc.detectors.cell_reselection_offset import CellReselectionOffsetDetector
+from icc.detectors.cell_reselection_hysteresis import CellReselectionHysteresisDetector
+
+from tests.test_gsmdecoder import frame, si3_dump, cipher_mode_command_dump
+
+
+class FakeTopBlock(object):
+    """
+    Stands in for a flowgraph that records until it is stopped
+    """
+
+    def __init__(self):
+        self.stopped = threading.Event()
+
+    def start(self):
+        pass
+
+    def wait(self):
+        self.stopped.wait(10)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def benignCell():
+    manager = DetectorManager()
+    manager.addDetector(A5Detector('a5_detector', 'a'))
+    manager.addDetector(IDRequestDetector('id_request_detector', 'a'))
+    manager.addDetector(CellReselectionOffsetDetector('cell_reselection_offset_detector', 'a'))
+    manager.addDetector(CellReselectionHysteresisDetector('cell_reselection_offset_hysteresis', 'a'))
+    return manager
+
+
+class SaturationTest(unittest.TestCase):
+
+    def testEventDrivenDetectorsDoNotBlock(self):
+        manager = benignCell()
+        self.assertFalse(manager.saturated())
+        # the cell broadcasts its system information, but no phone attaches to it
+        manager.dispatch(frame(si3_dump))
+        self.assertTrue(manager.saturated())
+        self.assertFalse(any(detector.saturated for detector in manager.detectors if detector.event_driven))
+
+    def testOnlyEventDrivenDetectors(self):
+        manager = DetectorManager()
+        manager.addDetector(A5Detector('a5_detector', 'a'))
+        self.assertFalse(manager.saturated())
+        manager.dispatch(frame(cipher_mode_command_dump))
+        self.assertFalse(manager.saturated())
+
+    def testEarlyStop(self):
+        manager = benignCell()
+        manager.dispatch(frame(si3_dump))
+        rec_time = run_until(FakeTopBlock(), manager.saturated, min_time=0.2, poll_interval=0.01)
+        self.assertTrue(0.2 <= rec_time < 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+from icc import gsmdecoder
+from icc import gsmpackets
+
+# GSMTap header of a frame on arfcn 10, followed by the channel_type byte and the sub_slot/end_junk bytes
+header = "02 04 01 00 00 0a 2d 06 00 01 02 03 %02x 00 00 00"
+
+# BCCH System Information Type 3 of cell 0x1a2b, MCC 204, MNC 08, LAC 0x0d02
+si3_dump = header % 1 + " 49 06 1b 1a 2b 02 f4 80 0d 02 49 03 0a 28 65 00 78 b9 00 8c 2b 2b 2b"
+# DTAP Ciphering Mode Command with A5/1
+cipher_mode_command_dump = header % 8 + " 01 20 0d 06 35 01 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b"
+# DTAP Identity Request for the IMSI
+identity_request_dump = header % 8 + " 01 20 09 05 18 01 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b 2b"
+
+
+def frame(dump):
+    return dump.replace(' ', '').decode('hex')
+
+
+class GSMDecoderTest(unittest.TestCase):
+
+    def assertSameLayers(self, data):
+        """
+        Walks the layers of the struct decoder and of scapy side by side and compares their fields
+        """
+        decoded = gsmdecoder.decode(data)
+        dissected = gsmpackets.GSMTap(data)
+        layers = 0
+        while dissected.name not in ("Raw", "NoPayload"):
+            self.assertEqual(decoded.name, dissected.name)
+            for field in dissected.fields_desc:
+                self.assertEqual(getattr(decoded, field.name), getattr(dissected, field.name),
+                                 "%s.%s" % (dissected.name, field.name))
+            decoded, dissected = decoded.payload, dissected.payload
+            layers += 1
+        return layers
+
+    def testSystemInfoType3(self):
+        data = frame(si3_dump)
+        self.assertEqual(self.assertSameLayers(data), 3)
+        si3 = gsmdecoder.decode(data).payload.payload
+        dissected = gsmpackets.GSMTap(data)[gsmpackets.SystemInfoType3]
+        self.assertEqual((si3.cid, si3.lac, si3.mcc, si3.mnc), (0x1a2b, 0x0d02, 204, 8))
+        self.assertEqual((si3.mcc, si3.mnc), (dissected.mcc, dissected.mnc))
+        self.assertEqual(gsmdecoder.peek(data), gsmdecoder.SI3_MESSAGE)
+
+    def testCipherModeCommand(self):
+        data = frame(cipher_mode_command_dump)
+        self.assertEqual(self.assertSameLayers(data), 4)
+        self.assertEqual(gsmdecoder.decode(data).payload.payload.payload.cipher_mode, 1)
+        self.assertEqual(gsmdecoder.peek(data), gsmdecoder.CIPHER_MODE_COMMAND_MESSAGE)
+
+    def testIdentityRequest(self):
+        data = frame(identity_request_dump)
+        self.assertEqual(self.assertSameLayers(data), 4)
+        self.assertEqual(gsmdecoder.decode(data).payload.payload.payload.id_type, 1)
+        self.assertEqual(gsmdecoder.peek(data), gsmdecoder.IDENTITY_REQUEST_MESSAGE)
+
+    def testArfcn(self):
+        data = frame(si3_dump)
+        self.assertEqual(gsmdecoder.decode(data).arfcn & gsmdecoder.ARFCN_MASK, 10)
+
+    def testTruncated(self):
+        self.assertIsNone(gsmdecoder.decode(frame(si3_dump)[:10]))
+        self.assertIsNone(gsmdecoder.peek(frame(si3_dump)[:10]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from collections import namedtuple
+import random
+import unittest
+
+from icc.cellinfochecks.neighbours import Mesh, neighbours
+
+Cell = namedtuple('Cell', ['arfcn', 'neighbours', 'cellobservation_id'])
+
+
+def components(mesh):
+    """
+    Sizes of the weakly connected components of mesh by breadth first search
+    """
+    undirected = dict((vertex, set()) for vertex in mesh.vertices())
+    for src, dsts in mesh.edges.iteritems():
+        for dst in dsts:
+            if dst in undirected:
+                undirected[src].add(dst)
+                undirected[dst].add(src)
+    sizes = {}
+    for start in undirected:
+        if start in sizes:
+            continue
+        seen, queue = set([start]), [start]
+        while queue:
+            for vertex in undirected[queue.pop()]:
+                if vertex not in seen:
+                    seen.add(vertex)
+                    queue.append(vertex)
+        for vertex in seen:
+            sizes[vertex] = len(seen)
+    return sizes
+
+
+class MeshTest(unittest.TestCase):
+
+    def testComponents(self):
+        mesh = Mesh()
+        for vertex in (1, 2, 3, 4, 5):
+            mesh.add_vertex(vertex)
+        mesh.add_edge((1, 2))
+        mesh.add_edge((3, 2))
+        mesh.add_edge((4, 6)) # 6 is not a vertex (yet)
+        self.assertEqual([mesh.component_size(v) for v in (1, 2, 3, 4, 5)], [3, 3, 3, 1, 1])
+        mesh.add_vertex(6)
+        self.assertEqual(mesh.component_size(4), 2)
+        self.assertEqual(mesh.find(4), mesh.find(6))
+        self.assertNotEqual(mesh.find(1), mesh.find(4))
+
+    def testDegrees(self):
+        mesh = Mesh()
+        for vertex in (1, 2, 3):
+            mesh.add_vertex(vertex)
+        mesh.add_edge((1, 2))
+        mesh.add_edge((1, 3))
+        mesh.add_edge((3, 2))
+        self.assertEqual([mesh.out_degree(v) for v in (1, 2, 3)], [2, 0, 1])
+        self.assertEqual([mesh.in_degree(v) for v in (1, 2, 3)], [0, 2, 1])
+        self.assertEqual(mesh.find_edges_to(2), set([(1, 2), (3, 2)]))
+
+    def testRandomGraphs(self):
+        generator = random.Random(0)
+        for i in xrange(100):
+            mesh = Mesh()
+            vertices = range(generator.randint(1, 30))
+            for vertex in vertices:
+                mesh.add_vertex(vertex)
+                for j in xrange(generator.randint(0, 3)):
+                    # edges may point to vertices that are added later or never
+                    mesh.add_edge((vertex, generator.randint(0, 40)))
+            expected = components(mesh)
+            for vertex in vertices:
+                self.assertEqual(mesh.component_size(vertex), expected[vertex])
+
+    def testAddMesh(self):
+        a, b = Mesh(), Mesh()
+        for mesh, (src, dst) in ((a, (1, 2)), (b, (2, 3))):
+            mesh.add_vertex(src)
+            mesh.add_vertex(dst)
+            mesh.add_edge((src, dst))
+        a.add_mesh(b)
+        self.assertEqual(a.component_size(1), 3)
+        self.assertEqual(a.in_degree(2), 1)
+        self.assertEqual(a.out_degree(2), 1)
+
+
+class NeighboursTest(unittest.TestCase):
+
+    def history(self):
+        # earlier scans: 1, 2 and 3 list each other
+        mesh = Mesh()
+        for vertex in (1, 2, 3):
+            mesh.add_vertex(vertex)
+        for edge in ((1, 2), (2, 3), (3, 1)):
+            mesh.add_edge(edge)
+        return mesh
+
+    def testNoNeighboursDespiteHistory(self):
+        mesh = self.history()
+        ranks = neighbours([Cell(1, [], 'a'), Cell(2, [3], 'b')], mesh)
+        by_cell = dict((rank.cellobs_id, rank.s_rank) for rank in ranks)
+        self.assertEqual(by_cell, {'a': 2, 'b': 0})
+        # the caller's mesh is left as it was
+        self.assertEqual(mesh.size(), 3)
+        self.assertEqual(mesh.out_degree(2), 1)
+
+    def testNotReferenced(self):
+        ranks = neighbours([Cell(7, [1], 'a')], self.history())
+        self.assertEqual([(rank.cellobs_id, rank.s_rank) for rank in ranks], [('a', 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
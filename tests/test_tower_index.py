@@ -0,0 +1,79 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy
+
+from icc.cellinfochecks import query_cell_tower
+from icc.cellinfochecks import tower_index
+
+
+class PackKeysTest(unittest.TestCase):
+
+    def testSortsLikeTuples(self):
+        random = numpy.random.RandomState(0)
+        keys = [(int(random.randint(0, 1000)), int(random.randint(0, 1000)),
+                 int(random.randint(0, 1 << 16)), int(random.randint(0, 1 << 28))) for i in xrange(1000)]
+        packed = tower_index.packKeys(*zip(*keys))
+        self.assertEqual([keys[i] for i in numpy.argsort(packed)], sorted(keys))
+
+    def testPackable(self):
+        mask = tower_index.packable([204, 1024, 204, 204, -1], [8, 8, 1024, 8, 8],
+                                    [1, 1, 1, 1 << 16, 1], [1, 1, 1, 1, 1])
+        self.assertEqual(list(mask), [True, False, False, False, False])
+
+
+class TowerIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, 'towers.sqlite')
+        connection = sqlite3.connect(self.database)
+        connection.execute('CREATE TABLE towers (radio VARCHAR, mcc INTEGER, net INTEGER, area INTEGER, cell INTEGER, '
+                           'unit VARCHAR, lon FLOAT, lat FLOAT, range INTEGER)')
+        # the csv importer stores missing values as empty strings
+        connection.executemany('INSERT INTO towers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+            ('GSM', '204', '8', '3330', '1', '', '6.8', '52.2', '1000'),
+            ('GSM', '204', '8', '3330', '1', '', '6.9', '52.3', '2000'),
+            ('GSM', '204', '16', '100', '2', '', '4.9', '52.4', ''),
+            ('GSM', '204', '8', '3330', '3', '', '', '', '500'),
+            ('GSM', '204', '8', '', '4', '', '6.9', '52.3', '10')])
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testLookup(self):
+        self.assertEqual(tower_index.buildTowerIndex(self.database), 3)
+        index = tower_index.TowerIndex(tower_index.indexPath(self.database))
+        self.assertEqual(sorted((t.lat, t.lon, t.range) for t in index.lookup(204, 8, 3330, 1)),
+                         [(52.2, 6.8, 1000), (52.3, 6.9, 2000)])
+        self.assertEqual([(t.lat, t.lon, t.range) for t in index.lookup(204, 16, 100, 2)], [(52.4, 4.9, 0)])
+        self.assertEqual(index.lookup(204, 8, 3330, 3), [])
+        self.assertEqual(index.lookup(204, 8, 1 << 16, 1), [])
+
+    def testLookupMany(self):
+        tower_index.buildTowerIndex(self.database)
+        index = tower_index.TowerIndex(tower_index.indexPath(self.database))
+        keys = [(204, 8, 3330, 1), (204, 16, 100, 2), (204, 8, 3330, 3), (-1, 8, 3330, 1)]
+        results = index.lookupMany(keys)
+        for key in keys:
+            self.assertEqual([(t.lat, t.lon, t.range) for t in results[key]],
+                             [(t.lat, t.lon, t.range) for t in index.lookup(*key)])
+
+    def testIndexBuiltLater(self):
+        tower_database = query_cell_tower.tower_database
+        query_cell_tower.tower_database = self.database
+        try:
+            self.assertIsNone(query_cell_tower.getTowerIndex())
+            tower_index.buildTowerIndex(self.database)
+            self.assertEqual(len(query_cell_tower.getTowerIndex().lookup(204, 8, 3330, 1)), 2)
+        finally:
+            query_cell_tower.tower_database = tower_database
+
+
+if __name__ == '__main__':
+    unittest.main()